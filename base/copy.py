@@ -1,97 +1,484 @@
+import hashlib
 import os
 import sys
+import threading
+import time
+from collections import Counter, deque
+from itertools import chain, zip_longest
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 
 from rich.live import Live
 from rich.text import Text
-from .console import console
+from .console import console, log
 from models.copy_item import CopyItem
 from models.store import store
 from progress.copy_progress import CopyProgress
-from .utils import free_space_in_gigabytes
-from .copy_with_progress import copy_with_callback, SameFileError
+from .utils import free_space_in_gigabytes, free_space_in_bytes, cluster_size_in_bytes
+from .copy_with_progress import copy_with_callback, copy_small_file, copy_to_many, copies_cancelled, partial_path, resumable_offset, verify_copy, SameFileError
+from .durability import DurabilityPolicy
+from .journal import CopyJournal, journal_path
+from .destination_index import DestinationIndex
+from .telemetry import CopyTelemetry
+from .ordering import disk_locations, estimate_seek_seconds, order_for_seeks
+from .packing import MOVIES, tv_units, movie_units, size_on_disk, pack, episodes_to_resume_after
+from .rate_limiter import AdaptiveTokenBucket
 
 progress: CopyProgress = CopyProgress()
 BYTES_TO_GB_FACTOR = 1024 * 1024 * 1024
 COPY_BUFFER = 16 * 1024 * 1024
+# Small files are handed to the small file workers this many at a time (and progress is updated once per batch)
+SMALL_FILE_BATCH = 16
+# Shared by every copy stream, so the speed limit (if any) applies to the whole session, not per file.
+# Its rate can be changed at any time with rate_limiter.set_rate(), or left to adapt itself (copy_speed_limit_adaptive)
+rate_limiter: AdaptiveTokenBucket = AdaptiveTokenBucket()
+# When to fsync copied files (copy_durability), set up when copying starts
+durability: DurabilityPolicy = DurabilityPolicy()
+# Records each completed copy (results/journal.<name>.jsonl), so an interrupted run can skip them next time
+journal: CopyJournal = CopyJournal()
+# What's already on the destination drive(s), from one walk of each output path (see index_destinations)
+destination_index: DestinationIndex = DestinationIndex()
+# Per-file metrics for the session, written to the session archive as JSON at the end
+telemetry: CopyTelemetry = CopyTelemetry()
+# Copies that failed verification (--verify), to be retried once everything else is done
+retry_queue: list = []
 
 
-def copy_current_file(copy_item: CopyItem):
-    progress.prep_current_file_progress(copy_item.file_name, copy_item.file_size)
+def copy_current_file(copy_item: CopyItem, library: str = None):
+    task = progress.add_file(copy_item.file_name, copy_item.file_size, completed=getattr(copy_item, '_resume_offset', 0))
     os.makedirs(copy_item.destination_folder, exist_ok=True)
+    checksum = _new_checksum()
+    stats = telemetry.start_file(copy_item.file_name, copy_item.file_size, library, copy_item.source_file, copy_item.destination_folder)
     try:
-        copy_with_callback(copy_item.source_file, copy_item.destination_file, progress.update_current_file_progress, COPY_BUFFER,
-                           speed_limit_mbps=store.active_speed_limit_mbps)
+        copy_with_callback(copy_item.source_file, copy_item.destination_file, progress.file_callback(task),
+                           buffer_size=COPY_BUFFER, rate_limiter=rate_limiter, pipelined=store.copy_pipelined,
+                           resume=store.copy_resume and not getattr(copy_item, '_recopy', False),
+                           atomic=store.copy_atomic, durability=durability,
+                           preallocate=store.copy_preallocate, drop_cache=store.copy_drop_page_cache,
+                           direct_io=store.copy_direct_io_threshold_gb is not None
+                           and copy_item.file_size >= store.copy_direct_io_threshold_gb * BYTES_TO_GB_FACTOR,
+                           checksum=checksum, clone=_clone_mode(), stats=stats)
     except SameFileError:
         console.log("SameFileError!")
-        pass
+        checksum = None
 
-    progress.complete_current_file()
+    telemetry.finish_file(stats)
+    if _check_copy(copy_item, checksum):
+        journal.record(copy_item)
+    progress.complete_file(task)
 
 
-def copy_queue(queue):
+def _clone_mode():
+    # Clones aren't hashed - so when checksums are wanted, copy the data
+    if store.copy_clone == "none" or store.copy_checksum or store.copy_verify:
+        return None
+    return store.copy_clone
+
+
+def _new_checksum():
+    return hashlib.blake2b() if store.copy_checksum or store.copy_verify else None
+
+
+def _check_copy(copy_item: CopyItem, checksum) -> bool:
+    """
+    Record the source's hash on the item (_checksum) and, with --verify, check the copy against it -
+    queueing the item for a retry if it doesn't match.
+    Returns False if verification failed
+    """
+    if checksum is None:
+        return True
+    copy_item._checksum = checksum.hexdigest()
+    if store.copy_verify and not verify_copy(copy_item.destination_file, hashlib.blake2b(), checksum.digest(), COPY_BUFFER):
+        log(f"Verification FAILED for '{copy_item.file_name}' - will retry", indent=1, style="danger")
+        retry_queue.append(copy_item)
+        return False
+    return True
+
+
+def _copy_small_batch(batch: list[CopyItem], library: str = None) -> int:
+    copied = 0
+    for copy_item in batch:
+        if copies_cancelled.is_set():
+            raise KeyboardInterrupt("Copy cancelled")
+        checksum = _new_checksum()
+        stats = telemetry.start_file(copy_item.file_name, copy_item.file_size, library, copy_item.source_file, copy_item.destination_folder)
+        write_start = time.monotonic()
+        try:
+            size = copy_small_file(copy_item.source_file, copy_item.destination_file, atomic=store.copy_atomic,
+                                   durability=durability, checksum=checksum, clone=_clone_mode())
+        except SameFileError:
+            console.log("SameFileError!")
+            checksum = None
+            size = 0
+        write_seconds = time.monotonic() - write_start
+        stats.record_chunk(size, write_seconds, rate_limiter.consume(size, copies_cancelled))
+        telemetry.finish_file(stats)
+        if _check_copy(copy_item, checksum):
+            journal.record(copy_item)
+        # (A clone copies no data, but it's done as far as progress is concerned)
+        copied += copy_item.file_size
+    return copied
+
+
+def copy_small_files(items: list[CopyItem], library: str = None):
+    """
+    The fast path for small files (under copy_small_file_threshold_mb - artwork, .nfo files, subtitles...).
+    Each destination folder is created once up front, then the files are copied in batches of SMALL_FILE_BATCH by a
+    pool of (up to) copy_small_file_workers threads, with one progress line for the lot, updated once per batch.
+    Each batch is between one pair of drives, and the per-drive limits (copy_streams_per_source_device and
+    copy_streams_per_destination_device) hold here too, as for copy_queue.
+    """
+    for folder in {copy_item.destination_folder for copy_item in items}:
+        os.makedirs(folder, exist_ok=True)
+
+    task = progress.add_file(f"{len(items)} small files", sum(copy_item.file_size for copy_item in items))
+    update = progress.file_callback(task)
+
+    items_by_devices = {}
+    destination_devices = {}
+    for copy_item in items:
+        items_by_devices.setdefault(_devices_of(copy_item, destination_devices), []).append(copy_item)
+    per_source = store.copy_streams_per_source_device or 1
+    per_destination = store.copy_streams_per_destination_device or 1
+    source_slots = {source: threading.Semaphore(per_source) for source, _ in items_by_devices}
+    destination_slots = {destination: threading.Semaphore(per_destination) for _, destination in items_by_devices}
+    workers = min(store.copy_small_file_workers or 1, per_source * len(source_slots), per_destination * len(destination_slots))
+
+    def copy_batch(devices, batch):
+        with source_slots[devices[0]], destination_slots[devices[1]]:
+            return _copy_small_batch(batch, library)
+
+    # Take turns between the pairs of drives, so the workers aren't all waiting on the same one
+    batches_by_devices = [[(devices, device_items[i:i + SMALL_FILE_BATCH]) for i in range(0, len(device_items), SMALL_FILE_BATCH)]
+                          for devices, device_items in items_by_devices.items()]
+    batches = [batch for batch in chain.from_iterable(zip_longest(*batches_by_devices)) if batch is not None]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for future in as_completed([executor.submit(copy_batch, devices, batch) for devices, batch in batches]):
+                update(future.result(), None, None)
+        except BaseException:
+            # Stop the other workers after their current file, rather than waiting for every batch
+            copies_cancelled.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+    progress.complete_file(task)
+
+
+def device_of_path(path, cache: dict = None):
+    """
+    Return the st_dev of the device holding path.  If path doesn't exist yet (e.g. a destination folder
+    we're about to create), use its nearest existing parent.
+    Optionally pass a dict to cache results per path.
+    """
+    if cache is not None and path in cache:
+        return cache[path]
+    existing = path
+    while not os.path.exists(existing):
+        parent = os.path.dirname(existing)
+        if parent == existing:
+            break
+        existing = parent
+    device = os.stat(existing).st_dev
+    if cache is not None:
+        cache[path] = device
+    return device
+
+
+def _devices_of(copy_item: CopyItem, destination_devices: dict = None):
+    """
+    The (source device, destination device) of a copy.  Pass a dict to cache the destination folders' devices.
+    """
+    source_device = getattr(copy_item, '_source_device', None)
+    if source_device is None:
+        source_device = os.stat(copy_item.source_file).st_dev
+    return source_device, device_of_path(copy_item.destination_folder, destination_devices)
+
+
+def copy_queue(queue, library: str = None):
     """
     Copy movies, showing a nice progress bar and updating the overall progress
+
+    Several files may be copied at once - the number of simultaneous copies reading from any one source device,
+    and writing to any one destination device, is limited by copy_streams_per_source_device and
+    copy_streams_per_destination_device (both default to 1, i.e. one file at a time per drive).
+    Files are started in queue order (or disk order, see copy_order_by_disk_location), skipping over any whose
+    drives are already busy.
+    On Ctrl-C (or any error), the copies in progress are stopped at their next chunk (see copies_cancelled).
     """
 
     if len(queue) == 0:
         console.log("COPY QUEUE IS EMPTY - We're done.")
         return
+    copies_cancelled.clear()
 
     # If we get here, we should do some actual copying!
     # _needs_copy is set by check_disk_space to avoid re-stating destination files.
-    # Fall back to a fresh stat check if check_disk_space wasn't called (e.g. pretend mode).
+    # Fall back to the destination index if check_disk_space wasn't called (e.g. pretend mode).
+    needed = []
     for potential_copy in queue:
         needs_copy = getattr(potential_copy, '_needs_copy', None)
         if needs_copy is None:
-            dest_size = os.path.getsize(potential_copy.destination_file) if os.path.exists(potential_copy.destination_file) else -1
-            needs_copy = dest_size != potential_copy.file_size
+            needs_copy = getattr(potential_copy, '_recopy', False) or destination_index.size_of(potential_copy.destination_file) != potential_copy.file_size
         if needs_copy:
-            copy_current_file(potential_copy)
+            needed.append(potential_copy)
+
+    if store.copy_order_by_disk_location and len(needed) > 1:
+        locations = disk_locations(needed)
+        seconds_before = estimate_seek_seconds(needed, locations)
+        needed = order_for_seeks(needed, locations)
+        seconds_after = estimate_seek_seconds(needed, locations)
+        console.log(f"Ordered {len(needed)} files by disk location - estimated source seek time "
+                    f"{seconds_before:.1f}s -> {seconds_after:.1f}s", style="info")
+
+    # Small files (that aren't being resumed) go to the fast path first
+    small_file_bytes = (store.copy_small_file_threshold_mb or 0) * 1024 * 1024
+    small = []
+    large = []
+    for copy_item in needed:
+        if copy_item.file_size < small_file_bytes and not getattr(copy_item, '_resume_offset', 0):
+            small.append(copy_item)
+        else:
+            large.append(copy_item)
+    if small:
+        copy_small_files(small, library)
+
+    # (source device, destination device) -> the files between them, in queue order (with their place in the queue)
+    pending = {}
+    destination_devices = {}
+    for position, copy_item in enumerate(large):
+        pending.setdefault(_devices_of(copy_item, destination_devices), deque()).append((position, copy_item))
 
+    per_source = store.copy_streams_per_source_device or 1
+    per_destination = store.copy_streams_per_destination_device or 1
+    max_streams = min(per_source * len({source for source, _ in pending}),
+                      per_destination * len({destination for _, destination in pending})) or 1
+    if max_streams > 1:
+        console.log(f"Copying up to {max_streams} files at once "
+                    f"({per_source} per source drive, {per_destination} per destination drive)", style="info")
+
+    busy_sources = Counter()
+    busy_destinations = Counter()
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_streams) as executor:
+        try:
+            while pending or running:
+                # Start everything we can, in queue order, without exceeding the per-device limits -
+                # only the first file between each pair of devices with a free stream on both can be next
+                while True:
+                    free = [devices for devices in pending
+                            if busy_sources[devices[0]] < per_source and busy_destinations[devices[1]] < per_destination]
+                    if not free:
+                        break
+                    devices = min(free, key=lambda d: pending[d][0][0])
+                    _, copy_item = pending[devices].popleft()
+                    if not pending[devices]:
+                        del pending[devices]
+                    busy_sources[devices[0]] += 1
+                    busy_destinations[devices[1]] += 1
+                    running[executor.submit(copy_current_file, copy_item, library)] = devices
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source_device, destination_device = running.pop(future)
+                    busy_sources[source_device] -= 1
+                    busy_destinations[destination_device] -= 1
+                    # Re-raise any exception from the copy
+                    future.result()
+        except BaseException:
+            # Stop the copies in progress at their next chunk, rather than waiting for them to finish
+            copies_cancelled.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    durability.end_library()
+    journal.sync()
     progress.complete_current_library()
 
 
+def _bytes_to_copy(item: CopyItem):
+    """
+    How many bytes still need to be copied for this item?
+    Uses the file_size already stored on the CopyItem (set when the queue was built) rather than re-stating
+    the source file. Files already fully copied need nothing, and (with copy_resume) a verified partial copy
+    (the .partial file, for atomic copies) only needs the rest.
+    Records the result on the item (_needs_copy, _resume_offset) for copy_queue.
+    """
+    # (_recopy - the destination is there at full size, but the copy journal says it's stale, see filter_copy_queue_by_already_copied_in_full)
+    item._needs_copy = getattr(item, '_recopy', False) or destination_index.size_of(item.destination_file) != item.file_size
+    item._resume_offset = 0
+    if not item._needs_copy:
+        return 0
+    if getattr(item, '_recopy', False):
+        return item.file_size
+    partial = partial_path(item.destination_file) if store.copy_atomic else item.destination_file
+    if store.copy_resume and destination_index.size_of(partial):
+        item._resume_offset = resumable_offset(item.source_file, partial)
+        if item._resume_offset:
+            log(f"Resuming partial copy of '{item.file_name}' from {item._resume_offset / BYTES_TO_GB_FACTOR:.2f} GB", indent=1, style="info")
+    return item.file_size - item._resume_offset
+
+
+def index_destinations():
+    """
+    Make sure the output paths being updated have been indexed (one walk of each, the first time)
+    """
+    destination_index.ensure(store.tv_output_path if store.update_tv else None,
+                             store.movie_output_path if store.update_movies else None)
+
+
 def check_disk_space(tv_copy_queue, movie_copy_queue):
     """
-    Does a basic check that we have enough room to do the copying.
-    Saves a bunch of useful info about needed and available space to the store
+    Works out how much space the copying needs, and checks it will fit on the destination drive(s).
+    If it won't, then (with copy_pack_to_fit) the queues are cut down to the most valuable subset that will fit -
+    see base/packing.py - and what was deferred is reported, otherwise we exit.
+    Saves a bunch of useful info about needed and available space to the store.
+    Returns the (possibly cut down) tv and movie copy queues
     """
 
-    if tv_copy_queue and store.update_tv and len(tv_copy_queue) > 0:
-        store.tv_available_space_gb = free_space_in_gigabytes(store.tv_output_path)
-        for item in tv_copy_queue:
-            # Use the file_size already stored on the CopyItem (set when the queue was built)
-            # rather than re-stating the source file. Only count files not already fully copied.
-            dest_size = os.path.getsize(item.destination_file) if os.path.exists(item.destination_file) else -1
-            if dest_size != item.file_size:
-                store.tv_needed_space_bytes += item.file_size
-                item._needs_copy = True
-            else:
-                item._needs_copy = False
-        store.tv_needed_space_gb = store.tv_needed_space_bytes / BYTES_TO_GB_FACTOR
-
-        if store.tv_needed_space_gb > store.tv_available_space_gb:
-            console.log(f"Not enough space for TV! (Needed {store.tv_needed_space_gb:.2f} GB, Available {store.tv_available_space_gb:.2f} GB)", style="danger")
-            sys.exit(1)
+    index_destinations()
 
-    if movie_copy_queue and store.update_movies and len(movie_copy_queue) > 0:
+    tv_copy_queue = tv_copy_queue if store.update_tv and tv_copy_queue else []
+    movie_copy_queue = movie_copy_queue if store.update_movies and movie_copy_queue else []
+
+    # The output paths may well be on the same drive, so the free space is worked out per device
+    output_paths = {}
+    units = []
+    if tv_copy_queue:
+        store.tv_available_space_gb = free_space_in_gigabytes(store.tv_output_path)
+        device = device_of_path(store.tv_output_path)
+        output_paths.setdefault(device, store.tv_output_path)
+        units += tv_units(tv_copy_queue, device, store.video_file_extensions)
+    if movie_copy_queue:
         store.movies_available_space_gb = free_space_in_gigabytes(store.movie_output_path)
-        for item in movie_copy_queue:
-            dest_size = os.path.getsize(item.destination_file) if os.path.exists(item.destination_file) else -1
-            if dest_size != item.file_size:
-                store.movies_needed_space_bytes += item.file_size
-                item._needs_copy = True
-            else:
-                item._needs_copy = False
-        store.movies_needed_space_gb = store.movies_needed_space_bytes / BYTES_TO_GB_FACTOR
-
-        if store.movies_needed_space_gb > store.movies_available_space_gb:
-            console.log(f"Not enough space for Movies! (Needed {store.movies_needed_space_gb:.2f} GB, Available {store.movies_available_space_gb:.2f} GB)", style="danger")
+        device = device_of_path(store.movie_output_path)
+        output_paths.setdefault(device, store.movie_output_path)
+        units += movie_units(movie_copy_queue, device)
+
+    cluster_sizes = {device: cluster_size_in_bytes(path) for device, path in output_paths.items()}
+    free_bytes = {device: free_space_in_bytes(path) for device, path in output_paths.items()}
+    needed_bytes = Counter()
+    for unit in units:
+        unit.size = sum(size_on_disk(_bytes_to_copy(item), cluster_sizes[unit.device]) for item in unit.items)
+        needed_bytes[unit.device] += unit.size
+
+    short = [device for device in output_paths if needed_bytes[device] > free_bytes[device]]
+    for device in short:
+        console.log(f"Not enough space on '{output_paths[device]}'! (Needed {needed_bytes[device] / BYTES_TO_GB_FACTOR:.2f} GB, "
+                    f"Available {free_bytes[device] / BYTES_TO_GB_FACTOR:.2f} GB)", style="danger")
+    if short:
+        if not store.copy_pack_to_fit:
+            console.log("Set copy_pack_to_fit in the paths YAML to copy what does fit, and defer the rest", style="info")
             sys.exit(1)
+        kept, deferred = pack(units, free_bytes)
+        _defer(kept, deferred)
+        kept_items = {id(item) for unit in kept for item in unit.items}
+        tv_copy_queue = [item for item in tv_copy_queue if id(item) in kept_items]
+        movie_copy_queue = [item for item in movie_copy_queue if id(item) in kept_items]
 
+    store.tv_needed_space_bytes = sum(_remaining_bytes(item) for item in tv_copy_queue)
+    store.tv_needed_space_gb = store.tv_needed_space_bytes / BYTES_TO_GB_FACTOR
+    store.movies_needed_space_bytes = sum(_remaining_bytes(item) for item in movie_copy_queue)
+    store.movies_needed_space_gb = store.movies_needed_space_bytes / BYTES_TO_GB_FACTOR
     store.total_needed_space_bytes = store.tv_needed_space_bytes + store.movies_needed_space_bytes
     store.total_needed_space_gb = store.total_needed_space_bytes / BYTES_TO_GB_FACTOR
 
+    return tv_copy_queue, movie_copy_queue
+
+
+def _remaining_bytes(item: CopyItem):
+    """ What _bytes_to_copy worked out for this item """
+    return item.file_size - item._resume_offset if item._needs_copy else 0
+
+
+def _defer(kept: list, deferred: list):
+    """
+    Report what packing deferred (logged, and listed in results/copy.deferred.<name>.txt), and wind back the
+    tracker for each show with deferred episodes - to the last episode being copied - and forget deferred movies
+    were available, so they are offered again next time
+    """
+    resume_points = episodes_to_resume_after(kept, deferred)
+    for show, resume_after in resume_points.items():
+        if not store.output_show_list or show not in store.output_show_list:
+            continue
+        if resume_after is None:
+            # Nothing of the show is being copied - back to where it started.  original_show_list is keyed by the
+            # subscription's name, so undo the folder name mapping (manual, or the automatic one) to find it
+            for name in (store.map_folder_to_show_name.get(show), store.folder_name_to_kodi_name(show), show):
+                if name in store.original_show_list:
+                    resume_after = store.original_show_list[name]
+                    break
+        if resume_after:
+            store.output_show_list[show] = list(resume_after)
+
+    deferred_movies = {unit.label for unit in deferred if unit.tier == MOVIES}
+    if store.movies_available:
+        store.movies_available = [movie for movie in store.movies_available if movie not in deferred_movies]
+
+    console.log(f"Deferred {len(deferred)} item(s) ({sum(unit.size for unit in deferred) / BYTES_TO_GB_FACTOR:.2f} GB) "
+                f"to make the copy fit:", style="warning")
+    deferred_file = f"{store.mediacopier_path}/results/copy.deferred.{store.name}.txt"
+    with open(deferred_file, "w", encoding='utf-8') as f:
+        for unit in deferred:
+            f.write(f"{unit.label} ({unit.size / BYTES_TO_GB_FACTOR:.2f} GB)\n")
+            if unit.show not in resume_points:
+                log(f"{unit.label} ({unit.size / BYTES_TO_GB_FACTOR:.2f} GB)", indent=1, style="warning")
+    for show in resume_points:
+        episodes = [unit for unit in deferred if unit.show == show]
+        season, episode = episodes[0].episode
+        log(f"{show}: {len(episodes)} episode(s) from S{season:02d}E{episode:02d} "
+            f"({sum(unit.size for unit in episodes) / BYTES_TO_GB_FACTOR:.2f} GB)", indent=1, style="warning")
+    console.log(f"Wrote '{deferred_file}'")
+
+
+def retry_failed_verifications(copy_retries=None):
+    """
+    Copy anything that failed verification once more, from scratch.  Anything that fails again is logged,
+    and listed in results/verify.failures.txt
+    Args:
+        copy_retries: copies a list of items again (verifying them, and re-queueing any that fail) - by default,
+            copy_queue as a 'Retries' library
+    """
+    if not retry_queue:
+        return
+    retries = list(retry_queue)
+    retry_queue.clear()
+    console.log(f"Retrying {len(retries)} file(s) that failed verification", style="warning")
+    for item in retries:
+        # A bad copy can't be resumed from
+        item._needs_copy = True
+        item._resume_offset = 0
+        for path in (item.destination_file, partial_path(item.destination_file)):
+            if os.path.exists(path):
+                os.remove(path)
+    if copy_retries is None:
+        progress.prep_library_progress("Retries", sum(item.file_size for item in retries))
+        copy_queue(retries, "Retries")
+    else:
+        copy_retries(retries)
+
+    failures = list(retry_queue)
+    retry_queue.clear()
+    if not failures:
+        console.log("All retried files verified OK", style="info")
+        return
+    failures_file = f"{store.mediacopier_path}/results/verify.failures.txt"
+    with open(failures_file, "w", encoding='utf-8') as f:
+        for item in failures:
+            f.write(f"{item.source_file} -> {item.destination_file}\n")
+    console.log(f"{len(failures)} file(s) failed verification twice - see '{failures_file}'", style="danger")
+    for item in failures:
+        log(item.destination_file, indent=1, style="danger")
+
+
+def _configure_rate_limiter(limiter: AdaptiveTokenBucket, settings):
+    """
+    Set a rate limiter up from a subscriber's settings (the store, or a snapshot of it)
+    """
+    if settings.copy_speed_limit_adaptive:
+        limiter.set_adaptive(True, settings.copy_speed_limit_mbps, settings.copy_speed_limit_burst_mb)
+    else:
+        limiter.set_adaptive(False)
+        limiter.set_rate(settings.active_speed_limit_mbps, settings.copy_speed_limit_burst_mb)
+
 
 def copy(tv_copy_queue, movie_copy_queue):
     console.rule("Now Copying Media")
@@ -106,17 +493,152 @@ def copy(tv_copy_queue, movie_copy_queue):
 
     console.log("\n\n")
 
+    _configure_rate_limiter(rate_limiter, store)
+    durability.configure(store.copy_durability, store.copy_durability_batch_gb)
+    journal.start(durability=durability)
+    telemetry.reset()
+
     progress.prep_overall_progress(store.total_needed_space_bytes)
-    live = Live(progress.layout, refresh_per_second=1)
+    live = Live(progress, refresh_per_second=1)
 
     with live:
         if store.update_tv:
             progress.prep_library_progress("TV Shows", store.tv_needed_space_bytes)
-            copy_queue(tv_copy_queue)
+            copy_queue(tv_copy_queue, "TV Shows")
         if store.update_movies:
             progress.prep_library_progress("Movies", store.movies_needed_space_bytes)
-            copy_queue(movie_copy_queue)
+            copy_queue(movie_copy_queue, "Movies")
+        retry_failed_verifications()
 
         # And, finally, we're done...
         progress.layout["upper"].size = 3
         progress.layout["lower"].update(Text("Copying has finished!"))
+
+    journal.close()
+    destination_index.clear()
+    durability.report()
+    write_telemetry()
+
+
+def write_telemetry(archive_paths: list = None):
+    """
+    Log the session's throughput per library & device, and save all the metrics to the session archive -
+    or to each of archive_paths (e.g. every fan-out subscriber's)
+    """
+    if not telemetry.files:
+        return
+    telemetry.report()
+    now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    for archive_path in dict.fromkeys(archive_paths or [store.session_archive_path]):
+        telemetry.write(f"{archive_path}/{now}.copy.telemetry.json")
+
+
+def copy_fan_out(plans: list):
+    """
+    Copy several subscribers' updates at once (see do_fan_out_update), reading each source file only once and
+    writing it to every subscriber drive that needs it (copy_to_many).
+    Each subscriber gets their own progress bar, speed limit, durability policy, journal and atomic/preallocate
+    settings.  Files are copied one at a time, in disk order (or queue order, see copy_order_by_disk_location).
+    Copies that fail verification are retried once everything else is done, as for copy().
+    The session's telemetry (all the subscribers' - they share the reads) is written to each subscriber's session archive.
+    Args:
+        plans: a list of (store snapshot, tv copy queue, movie copy queue), one per subscriber
+    """
+    console.rule("Now Copying Media (Fan-out)")
+
+    if store.pretend:
+        console.log("PRETEND MODE - NO ACTUAL COPYING DONE", style="warning")
+        return
+
+    # Who needs each source file?  And how much is each subscriber getting (whole files - there's no resuming here)
+    copies_of_source = {}
+    sources = []
+    bytes_for_subscriber = Counter()
+    for index, (settings, tv_copy_queue, movie_copy_queue) in enumerate(plans):
+        queue = (tv_copy_queue if settings.update_tv else []) + (movie_copy_queue if settings.update_movies else [])
+        for copy_item in queue:
+            if not getattr(copy_item, '_needs_copy', True):
+                continue
+            if copy_item.source_file not in copies_of_source:
+                copies_of_source[copy_item.source_file] = []
+                sources.append(copy_item)
+            copies_of_source[copy_item.source_file].append((index, copy_item))
+            bytes_for_subscriber[index] += copy_item.file_size
+
+    if not sources:
+        console.log("Nothing found in the queues to copy.", style="warning")
+        return
+    if store.copy_order_by_disk_location and len(sources) > 1:
+        sources = order_for_seeks(sources)
+    shared = sum(1 for copies in copies_of_source.values() if len(copies) > 1)
+    console.log(f"{len(sources)} files to copy for {len(plans)} subscribers - {shared} of them read once and written to several drives", style="info")
+
+    limiters = []
+    durabilities = []
+    journals = []
+    for settings, _, _ in plans:
+        limiter = AdaptiveTokenBucket()
+        _configure_rate_limiter(limiter, settings)
+        limiters.append(limiter)
+        durabilities.append(DurabilityPolicy(settings.copy_durability, settings.copy_durability_batch_gb))
+        journals.append(CopyJournal())
+        journals[-1].start(journal_path(settings.name), durabilities[-1])
+    checksums_wanted = any(settings.copy_checksum or settings.copy_verify for settings, _, _ in plans)
+    telemetry.reset()
+
+    console.log("\n\n")
+    progress.prep_overall_progress(sum(bytes_for_subscriber.values()))
+    destination_tasks = [progress.add_destination(settings.name, bytes_for_subscriber[index]) for index, (settings, _, _) in enumerate(plans)]
+    live = Live(progress, refresh_per_second=1)
+    copies_cancelled.clear()
+
+    def copy_source(source, copies):
+        """ Copy one source file to each of copies - a list of (subscriber index, copy item) """
+        for _, copy_item in copies:
+            os.makedirs(copy_item.destination_folder, exist_ok=True)
+        task = progress.add_file(source.file_name, source.file_size, copies=len(copies))
+        checksum = hashlib.blake2b() if checksums_wanted else None
+        file_stats = [telemetry.start_file(copy_item.file_name, copy_item.file_size, plans[index][0].name,
+                                           copy_item.source_file, copy_item.destination_folder) for index, copy_item in copies]
+        copy_to_many(source.source_file, [copy_item.destination_file for _, copy_item in copies],
+                     callbacks=[progress.destination_callback(task, destination_tasks[index]) for index, _ in copies],
+                     rate_limiters=[limiters[index] for index, _ in copies],
+                     durabilities=[durabilities[index] for index, _ in copies],
+                     buffer_size=COPY_BUFFER,
+                     atomic=[plans[index][0].copy_atomic for index, _ in copies],
+                     preallocate=[plans[index][0].copy_preallocate for index, _ in copies],
+                     checksum=checksum, stats=file_stats)
+        for stats in file_stats:
+            telemetry.finish_file(stats)
+        for index, copy_item in copies:
+            if checksum is not None:
+                copy_item._checksum = checksum.hexdigest()
+                if plans[index][0].copy_verify and not verify_copy(copy_item.destination_file, hashlib.blake2b(), checksum.digest(), COPY_BUFFER):
+                    log(f"Verification FAILED for '{copy_item.destination_file}' - will retry", indent=1, style="danger")
+                    # (So the retry knows whose copy it is)
+                    copy_item._subscriber = index
+                    retry_queue.append(copy_item)
+                    continue
+            journals[index].record(copy_item)
+        progress.complete_file(task)
+
+    def copy_retries(retries):
+        for copy_item in retries:
+            copy_source(copy_item, [(copy_item._subscriber, copy_item)])
+
+    with live:
+        for source in sources:
+            copy_source(source, copies_of_source[source.source_file])
+        retry_failed_verifications(copy_retries)
+
+        progress.layout["upper"].size = 3
+        progress.layout["lower"].update(Text("Copying has finished!"))
+
+    for (settings, _, _), policy, journal_for_subscriber in zip(plans, durabilities, journals):
+        policy.end_library()
+        journal_for_subscriber.sync()
+        journal_for_subscriber.close()
+        console.log(f"[dodger_blue1]{settings.name}[/dodger_blue1]:")
+        policy.report()
+    destination_index.clear()
+    write_telemetry([settings.session_archive_path for settings, _, _ in plans])
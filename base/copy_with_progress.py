@@ -5,16 +5,58 @@
 # https://stackoverflow.com/questions/29967487/get-progress-back-from-shutil-file-copy-thread/48450305#48450305
 # License: MIT License
 
+import contextlib
+import ctypes
+import errno
+import mmap
 import os
 import pathlib
+import queue
 import shutil
+import sys
+import threading
 import time
+from .rate_limiter import TokenBucket
 
 # how many bytes to read at once?
 # shutil.copy uses 1024 * 1024 if _WINDOWS else 64 * 1024
 # however, in my testing on MacOS with SSD, I've found a much larger buffer is faster
 BUFFER_SIZE = 4096 * 1024
 
+# when resuming a partial copy, how much of the end of the partial file must match the source
+RESUME_CHECK_BYTES = 4 * 1024 * 1024
+
+# fallocate(2) mode - reserve the blocks but leave the file size alone, so the size still shows how much
+# has actually been copied (which resuming relies on)
+FALLOC_FL_KEEP_SIZE = 0x01
+
+# how far behind the copy we keep asking for destination pages to be written back & dropped from the page cache
+# (dirty pages can't be dropped until they've been written)
+DROP_CACHE_WINDOW = 64 * 1024 * 1024
+
+# direct I/O needs buffers, file offsets and lengths aligned to (at least) the device's logical block size
+DIRECT_IO_ALIGNMENT = mmap.PAGESIZE
+
+# atomic copies are written to '.<name>.partial' alongside the destination, then renamed into place
+PARTIAL_SUFFIX = ".partial"
+
+# how many buffers the pipelined copy cycles through - one being written, the rest being read ahead
+PIPELINE_BUFFERS = 3
+
+# errno values meaning "the kernel/filesystem can't do an in-kernel copy here" (rather than a real I/O error),
+# in which case we quietly fall back to the next, slower, copy method
+_KERNEL_COPY_UNSUPPORTED = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTSOCK}
+
+# ioctl(FICLONE) - see linux/fs.h
+FICLONE = 0x40049409
+# errno values meaning "can't clone/link here" (filesystem without reflinks, no hard links on exFAT etc.),
+# in which case we quietly copy the data instead
+_CLONE_UNSUPPORTED = _KERNEL_COPY_UNSUPPORTED | {errno.ENOTTY, errno.EPERM, errno.EMLINK, errno.EBADF}
+
+# Set (e.g. on Ctrl-C) to stop every copy in progress at its next chunk - each raises KeyboardInterrupt, leaving
+# whatever it had copied (the .partial file, for atomic copies) in place to be resumed next time
+copies_cancelled = threading.Event()
+
 
 class SameFileError(OSError):
     """Raised when source and destination are the same file."""
@@ -26,7 +68,9 @@ class SpecialFileError(OSError):
 
 
 def copy_with_callback(
-        src, dest, callback=None, follow_symlinks=True, buffer_size=BUFFER_SIZE, speed_limit_mbps=None
+        src, dest, callback=None, follow_symlinks=True, buffer_size=BUFFER_SIZE, speed_limit_mbps=None, zero_copy=True,
+        pipelined=False, rate_limiter=None, resume=False, atomic=False, durability=None, preallocate=False,
+        drop_cache=False, direct_io=False, checksum=None, clone=None, stats=None
 ):
     """ Copy file with a callback.
         callback, if provided, must be a callable and will be
@@ -40,6 +84,34 @@ def copy_with_callback(
             callback will called as callback(bytes_copied since last callback, total bytes copied, total bytes in source file)
         follow_symlinks: bool; if True, follows symlinks
         buffer_size: how many bytes to copy before each call to the callback, default = 4Mb
+        speed_limit_mbps: optional speed limit in MB/s, for this copy only (ignored if rate_limiter is given)
+        zero_copy: bool; if True, copy in-kernel (os.copy_file_range, then os.sendfile) where available,
+            falling back to a read/write loop through Python if neither is supported
+        pipelined: bool; if True, read ahead on a separate thread into a small ring of reusable buffers while
+            the current buffer is written, so both disks stay busy (takes precedence over zero_copy, as an
+            in-kernel copy still alternates between reading and writing)
+        rate_limiter: optional TokenBucket shared with other copies, to limit their combined speed
+        resume: bool; if True and dest is a partial copy of src (see resumable_offset), carry on from where it
+            got to rather than starting again (the callback's total bytes copied then includes the resumed part)
+        atomic: bool; if True, copy to a temporary name (see partial_path) and rename it into place once complete,
+            so an interrupted copy never leaves a truncated file under the real name (resume then looks at the
+            temporary file)
+        durability: optional DurabilityPolicy, deciding whether/when to fsync the copied file
+        preallocate: bool; if True, reserve the destination's disk space up front where the filesystem supports it
+            (see _preallocate), for less fragmentation and so running out of space fails now, not part way through
+        drop_cache: bool; if True, use posix_fadvise to read the source sequentially/ahead, and drop the copied
+            parts of both files from the page cache as we go (see _PageCacheAdvisor)
+        direct_io: bool; if True, bypass the page cache entirely with O_DIRECT where the platform & filesystems allow
+            (see _copy_direct), otherwise copy as normal
+        checksum: optional hashlib object (e.g. hashlib.blake2b()), updated with the whole source file as it is
+            copied (on a separate thread, without reading the source twice) - read its digest afterwards,
+            e.g. to pass to verify_copy. The data has to pass through Python for this, so zero_copy is ignored.
+        clone: None, "reflink" or "hardlink" - if src and dest are on the same filesystem, don't copy the data at all:
+            "reflink" makes dest share src's blocks, copy-on-write (FICLONE - btrfs, XFS etc.), "hardlink" makes dest
+            a hard link to src.  Where that isn't possible, the file is copied as normal.  (No checksum is computed
+            for a cloned file)
+        stats: optional object with a record_chunk(bytes, write_seconds, throttled_seconds) method, called for each
+            chunk written (e.g. telemetry.FileStats)
 
     Returns:
         Full path to destination file
@@ -78,46 +150,746 @@ def copy_with_callback(
     if callback is not None and not callable(callback):
         raise ValueError("callback is not callable")
 
+    if rate_limiter is None and speed_limit_mbps:
+        rate_limiter = TokenBucket(speed_limit_mbps)
+
     if not follow_symlinks and srcfile.is_symlink():
         if destfile.exists():
             os.unlink(destfile)
         os.symlink(os.readlink(str(srcfile)), str(destfile))
     else:
+        write_to = pathlib.Path(partial_path(destfile)) if atomic else destfile
         size = os.stat(src).st_size
+        offset = resumable_offset(srcfile, write_to) if resume else 0
+        if clone and _clone(str(srcfile), str(write_to), clone, durability):
+            if callback is not None:
+                callback(size - offset, size, size)
+            # (A hard link *is* the source file, so already has its permissions)
+            if clone != "hardlink":
+                shutil.copymode(str(srcfile), str(write_to))
+            if atomic:
+                os.replace(write_to, destfile)
+            if durability is not None:
+                durability.file_complete(str(destfile), 0)
+            return str(destfile)
         with open(srcfile, "rb") as fsrc:
-            with open(destfile, "wb") as fdest:
-                _copyfileobj(
-                    fsrc, fdest, callback=callback, total=size, length=buffer_size,
-                    speed_limit_mbps=speed_limit_mbps
-                )
+            with open(write_to, "r+b" if offset else "wb") as fdest:
+                fsrc.seek(offset)
+                fdest.seek(offset)
+                if preallocate:
+                    _preallocate(fdest.fileno(), offset, size - offset)
+                advisor = _PageCacheAdvisor(fsrc.fileno(), fdest.fileno(), offset, buffer_size) if drop_cache else None
+                report = _ChunkReporter(fdest, callback=callback, total=size, rate_limiter=rate_limiter, cache_advisor=advisor, stats=stats)
+                hasher = _Hasher(checksum) if checksum is not None else None
+                try:
+                    if hasher is not None and offset:
+                        # Resuming - the part already copied has to be hashed too
+                        hasher.feed_from(fsrc.fileno(), 0, offset, buffer_size)
+                    copied = offset
+                    if direct_io:
+                        copied = _copy_direct(fsrc, fdest, report, total=size, length=buffer_size, offset=copied, hasher=hasher)
+                    if copied < size and pipelined:
+                        fsrc.seek(copied)
+                        fdest.seek(copied)
+                        copied = _copyfileobj_pipelined(fsrc, fdest, report, length=buffer_size, offset=copied, hasher=hasher)
+                    elif copied < size and zero_copy and hasher is None:
+                        copied = _copy_kernel(fsrc, fdest, report, total=size, length=buffer_size, offset=copied)
+                    if copied < size:
+                        # Other methods unavailable (or only partly done) - finish with the plain loop from wherever they got to
+                        fsrc.seek(copied)
+                        fdest.seek(copied)
+                        copied = _copyfileobj(fsrc, fdest, report, length=buffer_size, offset=copied, hasher=hasher)
+                finally:
+                    if hasher is not None:
+                        hasher.close()
+                # (In case the source shrank since a partial copy was made)
+                fdest.truncate(copied)
+                if advisor is not None:
+                    advisor.finish()
+                if durability is not None:
+                    durability.sync_file(fdest)
+        shutil.copymode(str(srcfile), str(write_to))
+        if atomic:
+            os.replace(write_to, destfile)
+        if durability is not None:
+            durability.file_complete(str(destfile), copied - offset)
+        return str(destfile)
     shutil.copymode(str(srcfile), str(destfile))
     return str(destfile)
 
 
-def _copyfileobj(fsrc, fdest, callback, total, length, speed_limit_mbps=None):
+def copy_to_many(src, dests, callbacks=None, rate_limiters=None, durabilities=None, buffer_size=BUFFER_SIZE,
+                 atomic=False, preallocate=False, checksum=None, buffers=PIPELINE_BUFFERS, stats=None):
+    """
+    Copy src to several destinations, reading it just once (a tee).
+    This thread reads src into a ring of buffers, and each destination has its own writer thread - with its own
+    progress callback, rate limiter and durability policy.  A buffer goes back to be refilled once every destination
+    (and the hasher, if checksumming) is done with it, so the destinations are written side by side, with the slowest
+    setting the pace once the ring is full.
+    Each destination is written from the start (no resume).
+
+    Args:
+        src: source file
+        dests: destination files (not folders)
+        callbacks, rate_limiters, durabilities, stats: optional lists with an entry (which may be None) per
+            destination, as per copy_with_callback's callback, rate_limiter, durability and stats
+        atomic, preallocate: as per copy_with_callback - either one setting for all the destinations, or a list
+            with one per destination
+        buffer_size, checksum: as per copy_with_callback
+        buffers: how many buffer_size buffers to cycle through
+    Returns:
+        the destination files
+    Raises:
+        SameFileError if src is one of the destinations
+    """
+    dests = [os.fsdecode(dest) for dest in dests]
+    callbacks = callbacks or [None] * len(dests)
+    rate_limiters = rate_limiters or [None] * len(dests)
+    durabilities = durabilities or [None] * len(dests)
+    stats = stats or [None] * len(dests)
+    atomics = list(atomic) if isinstance(atomic, (list, tuple)) else [atomic] * len(dests)
+    preallocates = list(preallocate) if isinstance(preallocate, (list, tuple)) else [preallocate] * len(dests)
+    for dest in dests:
+        if os.path.exists(dest) and os.path.samefile(src, dest):
+            raise SameFileError(f"source file `{src}` and destination file `{dest}` are the same file.")
+    write_tos = [partial_path(dest) if dest_atomic else dest for dest, dest_atomic in zip(dests, atomics)]
+
+    free_buffers = queue.Queue()
+    for _ in range(buffers):
+        free_buffers.put(bytearray(buffer_size))
+    # How many of the writers (& hasher) are yet to finish with each buffer
+    users = {}
+    users_lock = threading.Lock()
+    errors = []
+
+    def release(buf):
+        with users_lock:
+            users[id(buf)] -= 1
+            finished = users[id(buf)] == 0
+        if finished:
+            free_buffers.put(buf)
+
+    def writer(fdest, report, chunks):
+        copied = 0
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                return
+            buf, bytes_read = chunk
+            try:
+                # After an error anywhere, just hand the buffers back
+                if not errors:
+                    chunk_start = time.monotonic()
+                    fdest.write(memoryview(buf)[:bytes_read])
+                    copied += bytes_read
+                    report(bytes_read, copied, time.monotonic() - chunk_start)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                release(buf)
+
+    with contextlib.ExitStack() as files:
+        fsrc = files.enter_context(open(src, "rb"))
+        size = os.fstat(fsrc.fileno()).st_size
+        fdests = [files.enter_context(open(write_to, "wb")) for write_to in write_tos]
+        for fdest, dest_preallocate in zip(fdests, preallocates):
+            if dest_preallocate:
+                _preallocate(fdest.fileno(), 0, size)
+        hasher = _Hasher(checksum) if checksum is not None else None
+        chunk_queues = [queue.Queue() for _ in fdests]
+        writers = [threading.Thread(target=writer, name=f"tee-writer-{index}", daemon=True,
+                                    args=(fdest, _ChunkReporter(fdest, callback=callbacks[index], total=size, rate_limiter=rate_limiters[index], stats=stats[index]), chunk_queues[index]))
+                   for index, fdest in enumerate(fdests)]
+        for thread in writers:
+            thread.start()
+        copied = 0
+        try:
+            while not errors:
+                buf = free_buffers.get()
+                bytes_read = fsrc.readinto(buf)
+                if not bytes_read:
+                    break
+                copied += bytes_read
+                with users_lock:
+                    users[id(buf)] = len(fdests) + (hasher is not None)
+                if hasher is not None:
+                    hasher.feed(memoryview(buf)[:bytes_read], done=lambda b=buf: release(b))
+                for chunks in chunk_queues:
+                    chunks.put((buf, bytes_read))
+        except BaseException as e:
+            # (e.g. Ctrl-C) - so the writers skip whatever is still queued, rather than finishing the file
+            errors.append(e)
+            raise
+        finally:
+            for chunks in chunk_queues:
+                chunks.put(None)
+            for thread in writers:
+                thread.join()
+            if hasher is not None:
+                hasher.close()
+        if errors:
+            raise errors[0]
+        for fdest, durability in zip(fdests, durabilities):
+            if durability is not None:
+                durability.sync_file(fdest)
+
+    for dest, write_to, dest_atomic, durability in zip(dests, write_tos, atomics, durabilities):
+        shutil.copymode(src, write_to)
+        if dest_atomic:
+            os.replace(write_to, dest)
+        if durability is not None:
+            durability.file_complete(dest, copied)
+    return dests
+
+
+def copy_small_file(src, dest, atomic=False, durability=None, checksum=None, clone=None):
+    """
+    Copy a small file (artwork, .nfo, subtitles...) in one go - for files where the per-file overhead of
+    copy_with_callback (path checks, progress callbacks, copymode) outweighs the data itself.
+    The whole file is read into memory with a single read, and dest is created with src's permissions
+    (so no separate copymode).  dest's folder must already exist, and dest must be a file path (not a folder).
+
+    Args:
+        src, dest: file paths
+        atomic, durability, checksum, clone: as per copy_with_callback
+    Returns:
+        number of bytes copied (0 if cloned)
+    Raises:
+        SameFileError if src and dest are the same file
+    """
+    src_stat = os.stat(src)
+    try:
+        dest_stat = os.stat(dest)
+    except FileNotFoundError:
+        dest_stat = None
+    if dest_stat is not None and os.path.samestat(src_stat, dest_stat):
+        raise SameFileError(f"source file `{src}` and destination file `{dest}` are the same file.")
+    write_to = partial_path(dest) if atomic else dest
+    if clone and _clone(src, write_to, clone, durability):
+        if clone != "hardlink":
+            shutil.copymode(src, write_to)
+        if atomic:
+            os.replace(write_to, dest)
+        if durability is not None:
+            durability.file_complete(os.fsdecode(dest), 0)
+        return 0
+    with open(src, "rb", buffering=0) as fsrc:
+        data = fsrc.readall()
+    if checksum is not None:
+        checksum.update(data)
+    mode = src_stat.st_mode & 0o777
+    fd = os.open(write_to, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), mode)
+    if hasattr(os, "fchmod"):
+        # os.open's mode is cut down by the umask, and not applied at all to a file that already exists -
+        # set it exactly, as copymode does for the large file path
+        os.fchmod(fd, mode)
+    with open(fd, "wb") as fdest:
+        fdest.write(data)
+        if durability is not None:
+            durability.sync_file(fdest)
+    if atomic:
+        os.replace(write_to, dest)
+    if durability is not None:
+        durability.file_complete(os.fsdecode(dest), len(data))
+    return len(data)
+
+
+def partial_path(dest):
+    """
+    The temporary name an atomic copy to dest is written to, before being renamed into place
+    """
+    folder, name = os.path.split(os.fsdecode(dest))
+    return os.path.join(folder, f".{name}{PARTIAL_SUFFIX}")
+
+
+def _clone(src, write_to, clone, durability=None):
+    """
+    Make write_to a reflink of, or hard link to, src (see copy_with_callback's clone) - if they're on the same
+    filesystem, and it supports that.
+    An existing write_to (e.g. a partial copy) is only replaced if this works.
+    Returns:
+        True if done, False if the data needs copying after all
+    """
+    try:
+        if os.stat(os.path.dirname(os.path.abspath(write_to))).st_dev != os.stat(src).st_dev:
+            return False
+        if clone == "hardlink":
+            if os.path.lexists(write_to):
+                link_to = f"{write_to}.link"
+                os.link(src, link_to)
+                os.replace(link_to, write_to)
+            else:
+                os.link(src, write_to)
+            return True
+        if clone != "reflink":
+            return False
+        try:
+            import fcntl
+        except ImportError:
+            # Windows
+            return False
+        with open(src, "rb") as fsrc:
+            # Not truncated (yet) - if the clone fails, write_to is left as it was
+            with open(os.open(write_to, os.O_WRONLY | os.O_CREAT, 0o666), "wb") as fdest:
+                fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+                if durability is not None:
+                    durability.sync_file(fdest)
+        return True
+    except OSError as e:
+        if e.errno in _CLONE_UNSUPPORTED:
+            return False
+        raise
+
+
+def _load_fallocate():
+    """
+    libc's fallocate(), where there is one (Linux).
+    (Not os.posix_fallocate - glibc 'emulates' that on filesystems without fallocate support, e.g. exFAT, by writing
+    to every block of the file, which is slow and changes the file's size)
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+    for name in ("fallocate64", "fallocate"):
+        fallocate = getattr(libc, name, None)
+        if fallocate is not None:
+            fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+            fallocate.restype = ctypes.c_int
+            return fallocate
+    return None
+
+
+_fallocate = _load_fallocate()
+
+
+def _preallocate(fd, offset, length):
+    """
+    Reserve length bytes of disk space for the file from offset, as one allocation rather than chunk by chunk.
+    Quietly does nothing where that isn't supported (platform or filesystem).
+    Raises:
+        OSError (ENOSPC) if there isn't room for the file
+    """
+    if _fallocate is None or length <= 0:
+        return
+    if _fallocate(fd, FALLOC_FL_KEEP_SIZE, offset, length) != 0:
+        error = ctypes.get_errno()
+        if error in (errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS, errno.EINVAL):
+            return
+        # Give back anything that did get reserved past the end of the file
+        os.ftruncate(fd, offset)
+        raise OSError(error, os.strerror(error))
+
+
+def resumable_offset(src, dest, check_bytes=RESUME_CHECK_BYTES):
+    """
+    Is dest a partial copy of src (e.g. from an interrupted copy) that can be carried on from?
+    It must be smaller than src, and its last check_bytes must match src at the same offset.
+    Returns:
+        the number of bytes of dest that can be kept (0 if it must be copied from scratch)
+    """
+    try:
+        dest_size = os.path.getsize(dest)
+        src_size = os.path.getsize(src)
+    except OSError:
+        return 0
+    if not 0 < dest_size < src_size:
+        return 0
+    start = max(0, dest_size - check_bytes)
+    with open(src, "rb") as fsrc, open(dest, "rb") as fdest:
+        fsrc.seek(start)
+        fdest.seek(start)
+        if fsrc.read(dest_size - start) != fdest.read(dest_size - start):
+            return 0
+    return dest_size
+
+
+def _kernel_copy_functions():
+    """
+    The in-kernel copy calls available on this platform, fastest first.
+    Each is called as f(src_fd, dest_fd, offset, count) and returns the number of bytes copied (0 at EOF).
+    """
+    functions = []
+    if hasattr(os, "copy_file_range"):
+        functions.append(_copy_file_range)
+    if hasattr(os, "sendfile"):
+        functions.append(_sendfile)
+    return functions
+
+
+def _copy_file_range(src_fd, dest_fd, offset, count):
+    return os.copy_file_range(src_fd, dest_fd, count, offset, offset)
+
+
+def _sendfile(src_fd, dest_fd, offset, count):
+    # sendfile writes at the destination's current position, so put it where we want it
+    os.lseek(dest_fd, offset, os.SEEK_SET)
+    return os.sendfile(dest_fd, src_fd, offset, count)
+
+
+def _copy_kernel(fsrc, fdest, report, total, length, offset=0):
+    """ copy from fsrc to fdest in-kernel, so the data never passes through Python bytes objects
+    Tries os.copy_file_range, then os.sendfile, moving on to the next method if one isn't supported.
+    Args: as per _copyfileobj, plus
+        total: total bytes in source file
+    Returns:
+        number of bytes copied - if less than total, the caller should finish the copy some other way
+    """
+    src_fd = fsrc.fileno()
+    dest_fd = fdest.fileno()
+    copied = offset
+    for kernel_copy in _kernel_copy_functions():
+        try:
+            while copied < total:
+                chunk_start = time.monotonic()
+                chunk = kernel_copy(src_fd, dest_fd, copied, length)
+                if not chunk:
+                    # Some filesystems report 0 rather than an error when they can't do this
+                    if copied == offset:
+                        break
+                    return copied
+                copied += chunk
+                report(chunk, copied, time.monotonic() - chunk_start)
+            else:
+                return copied
+        except OSError as e:
+            if e.errno not in _KERNEL_COPY_UNSUPPORTED:
+                raise
+    return copied
+
+
+def _copy_direct(fsrc, fdest, report, total, length, offset=0, hasher=None):
+    """ copy from fsrc to fdest with direct I/O (O_DIRECT), bypassing the page cache on both sides
+    So no gigabytes of dirty pages build up and then stall everything during writeback - just steady throughput.
+    Reads & writes go through one reusable page-aligned (mmap) buffer, in multiples of DIRECT_IO_ALIGNMENT.
+    The unaligned tail of the file is written with O_DIRECT turned back off.
+    Linux only - and not every filesystem supports O_DIRECT (e.g. tmpfs, some FUSE mounts).
+    Args: as per _copy_kernel, plus
+        hasher: optional _Hasher to feed the data to (it hashes each chunk while it is being written)
+    Returns:
+        number of bytes copied - if direct I/O isn't possible here, offset (i.e. nothing done), and
+        the caller should copy some other way
+    """
+    if not hasattr(os, "O_DIRECT") or offset % DIRECT_IO_ALIGNMENT:
+        return offset
+    import fcntl
+
+    length = max(length - length % DIRECT_IO_ALIGNMENT, DIRECT_IO_ALIGNMENT)
+    src_fd = fsrc.fileno()
+    dest_fd = fdest.fileno()
+    original_flags = {fd: fcntl.fcntl(fd, fcntl.F_GETFL) for fd in (src_fd, dest_fd)}
+    try:
+        for fd, flags in original_flags.items():
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_DIRECT)
+    except OSError as e:
+        if e.errno != errno.EINVAL:
+            raise
+        for fd, flags in original_flags.items():
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+        return offset
+
+    copied = offset
+    buf = mmap.mmap(-1, length)
+    view = memoryview(buf)
+    hashed = threading.Event()
+    hashed.set()
+    try:
+        while copied < total:
+            bytes_read = os.preadv(src_fd, [buf], copied)
+            if not bytes_read:
+                break
+            if hasher is not None:
+                hashed.clear()
+                hasher.feed(view[:bytes_read], done=hashed.set)
+            chunk_start = time.monotonic()
+            aligned = bytes_read - bytes_read % DIRECT_IO_ALIGNMENT
+            if aligned:
+                os.pwrite(dest_fd, view[:aligned], copied)
+            if aligned < bytes_read:
+                # The tail of the file - can't be written with O_DIRECT
+                fcntl.fcntl(dest_fd, fcntl.F_SETFL, original_flags[dest_fd])
+                os.pwrite(dest_fd, view[aligned:bytes_read], copied + aligned)
+            copied += bytes_read
+            report(bytes_read, copied, time.monotonic() - chunk_start)
+            # The buffer can't be reused until it has been hashed
+            hashed.wait()
+    finally:
+        hashed.wait()
+        view.release()
+        buf.close()
+        for fd, flags in original_flags.items():
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+    return copied
+
+
+class _ChunkReporter:
+    """
+    Per-chunk bookkeeping shared by all the copy loops - call the callback, give page cache hints (if wanted),
+    tell the rate limiter (if any) how the write went, and throttle to its rate.
+    Raises KeyboardInterrupt once copies_cancelled is set, so the copy stops there.
+    If the rate limiter wants honest write throughput figures (see AdaptiveTokenBucket), also flush the
+    destination to disk every sync_interval_bytes, so the page cache doesn't hide how fast the drive really is.
+    """
+
+    def __init__(self, fdest, callback=None, total=0, rate_limiter=None, cache_advisor=None, stats=None):
+        self.fdest = fdest
+        self.cache_advisor = cache_advisor
+        self.callback = callback
+        self.total = total
+        self.rate_limiter = rate_limiter
+        self.stats = stats
+        self.sync_interval_bytes = getattr(rate_limiter, "sync_interval_bytes", None)
+        self.bytes_since_sync = 0
+
+    def __call__(self, chunk_bytes, copied, write_seconds):
+        """
+        Args:
+            chunk_bytes: bytes copied by this chunk
+            copied: total bytes copied so far
+            write_seconds: how long the write (or in-kernel copy) of this chunk took
+        """
+        if copies_cancelled.is_set():
+            raise KeyboardInterrupt("Copy cancelled")
+        if self.callback is not None:
+            self.callback(chunk_bytes, copied, self.total)
+        if self.cache_advisor is not None:
+            self.cache_advisor.advance(copied)
+        throttled_seconds = 0.0
+        if self.rate_limiter is not None:
+            if self.sync_interval_bytes:
+                self.bytes_since_sync += chunk_bytes
+                if self.bytes_since_sync >= self.sync_interval_bytes:
+                    self.bytes_since_sync = 0
+                    sync_start = time.monotonic()
+                    self.fdest.flush()
+                    _fdatasync(self.fdest.fileno())
+                    write_seconds += time.monotonic() - sync_start
+            self.rate_limiter.observe(chunk_bytes, write_seconds)
+            throttled_seconds = self.rate_limiter.consume(chunk_bytes, copies_cancelled)
+        if self.stats is not None:
+            self.stats.record_chunk(chunk_bytes, write_seconds, throttled_seconds)
+
+
+class _PageCacheAdvisor:
+    """
+    Stops a big copy pushing everything else (Kodi, Sonarr etc.) out of the page cache.
+    Tells the kernel the source will be read sequentially, asks for the next chunk to be read ahead, and drops
+    each part of the source from the cache once copied.  Destination pages can only be dropped once written to disk,
+    so we keep asking for the last DROP_CACHE_WINDOW written to be written back & dropped, and for the whole file
+    once it is done.
+    All hints - does nothing where posix_fadvise isn't available (e.g. Windows).
+    """
+
+    def __init__(self, src_fd, dest_fd, offset, length):
+        self.src_fd = src_fd
+        self.dest_fd = dest_fd
+        self.offset = offset
+        self.length = length
+        self.dropped_src = offset
+        _fadvise(src_fd, offset, 0, "POSIX_FADV_SEQUENTIAL")
+        _fadvise(src_fd, offset, length, "POSIX_FADV_WILLNEED")
+
+    def advance(self, copied):
+        _fadvise(self.src_fd, copied, self.length, "POSIX_FADV_WILLNEED")
+        _fadvise(self.src_fd, self.dropped_src, copied - self.dropped_src, "POSIX_FADV_DONTNEED")
+        self.dropped_src = copied
+        drop_from = max(self.offset, copied - DROP_CACHE_WINDOW)
+        _fadvise(self.dest_fd, drop_from, copied - drop_from, "POSIX_FADV_DONTNEED")
+
+    def finish(self):
+        # (length 0 = to the end of the file)
+        _fadvise(self.dest_fd, self.offset, 0, "POSIX_FADV_DONTNEED")
+
+
+def _fadvise(fd, offset, length, advice):
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, getattr(os, advice))
+    except OSError:
+        # Only ever a hint
+        pass
+
+
+class _Hasher:
+    """
+    Updates a hashlib object with the copied data on a separate thread, so hashing overlaps the copy
+    (hashlib releases the GIL while hashing large buffers).
+    Chunks are hashed in the order fed; done, if given, is called once a chunk has been hashed (i.e. its buffer
+    can be reused).
+    """
+
+    def __init__(self, checksum, max_pending=PIPELINE_BUFFERS):
+        self.checksum = checksum
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="copy-hasher", daemon=True)
+        self._thread.start()
+
+    def feed(self, data, done=None):
+        self._queue.put((data, done))
+
+    def feed_from(self, fd, start, end, length):
+        """ Hash part of a file that we aren't otherwise going to read (e.g. the already copied part, when resuming) """
+        position = start
+        while position < end:
+            data = os.pread(fd, min(length, end - position), position)
+            if not data:
+                break
+            self.feed(data)
+            position += len(data)
+
+    def close(self):
+        """ Wait for everything fed so far to be hashed """
+        self._queue.put((None, None))
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            data, done = self._queue.get()
+            if data is None:
+                return
+            try:
+                if self.error is None:
+                    self.checksum.update(data)
+            except BaseException as e:
+                self.error = e
+            finally:
+                # Drop our reference to the chunk before handing its buffer back
+                data = None
+                if done is not None:
+                    done()
+
+
+def verify_copy(dest, checksum, expected_digest, buffer_size=BUFFER_SIZE):
+    """
+    Re-read dest from the disk itself (not the page cache) and check its hash matches the source's.
+    Uses O_DIRECT where possible - otherwise flushes the file and drops it from the page cache before reading.
+    (On platforms with neither, e.g. Windows, the read may be served from the cache)
+    Args:
+        dest: the copied file
+        checksum: a fresh hashlib object of the same type used while copying, e.g. hashlib.blake2b()
+        expected_digest: the source's digest() from the copy
+    Returns:
+        True if dest matches
+    """
+    length = max(buffer_size - buffer_size % DIRECT_IO_ALIGNMENT, DIRECT_IO_ALIGNMENT)
+    fd = None
+    if hasattr(os, "O_DIRECT"):
+        try:
+            fd = os.open(dest, os.O_RDONLY | os.O_DIRECT)
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+    if fd is not None:
+        buf = mmap.mmap(-1, length)
+        view = memoryview(buf)
+        try:
+            while True:
+                bytes_read = os.readv(fd, [buf])
+                if not bytes_read:
+                    break
+                checksum.update(view[:bytes_read])
+        finally:
+            view.release()
+            buf.close()
+            os.close(fd)
+    else:
+        with open(dest, "rb") as f:
+            _fdatasync(f.fileno())
+            _fadvise(f.fileno(), 0, 0, "POSIX_FADV_DONTNEED")
+            while True:
+                data = f.read(length)
+                if not data:
+                    break
+                checksum.update(data)
+    return checksum.digest() == expected_digest
+
+
+def _fdatasync(fd):
+    # No fdatasync on e.g. Windows/macOS
+    getattr(os, "fdatasync", os.fsync)(fd)
+
+
+def _copyfileobj(fsrc, fdest, report, length, offset=0, hasher=None):
     """ copy from fsrc to fdest
     Args:
         fsrc: filehandle to source file
         fdest: filehandle to destination file
-        callback: callable callback that will be called after every length bytes copied
-        total: total bytes in source file (will be passed to callback)
-        length: how many bytes to copy at once (between calls to callback)
-        speed_limit_mbps: optional speed limit in MB/s; if set, throttles writes via sleep
+        report: _ChunkReporter, called after every length bytes copied (calls the callback, throttles etc.)
+        length: how many bytes to copy at once (between calls to report)
+        offset: bytes already copied (both handles must already be positioned here)
+        hasher: optional _Hasher to feed the data to
+    Returns:
+        total bytes copied
     """
-    copied = 0
+    copied = offset
     while True:
         buf = fsrc.read(length)
         if not buf:
             break
+        if hasher is not None:
+            hasher.feed(buf)
         chunk_start = time.monotonic()
         fdest.write(buf)
         copied += len(buf)
-        if callback is not None:
-            callback(len(buf), copied, total)
-        # Throttle if a speed limit is configured: sleep for however long this chunk
-        # should have taken at the target rate, minus however long it actually took.
-        if speed_limit_mbps:
-            target_seconds = len(buf) / (speed_limit_mbps * 1024 * 1024)
-            elapsed = time.monotonic() - chunk_start
-            if target_seconds > elapsed:
-                time.sleep(target_seconds - elapsed)
+        report(len(buf), copied, time.monotonic() - chunk_start)
+    return copied
+
+
+def _copyfileobj_pipelined(fsrc, fdest, report, length, offset=0, buffers=PIPELINE_BUFFERS, hasher=None):
+    """ copy from fsrc to fdest, overlapping reads and writes
+    A reader thread fills a ring of reusable buffers, while this thread writes them out and hands them back,
+    so the source is being read while the destination is being written, and vice versa.
+    Args: as per _copyfileobj, plus
+        buffers: how many length sized buffers to cycle through
+    (With a hasher, each buffer goes reader -> writer -> hasher, and back to the reader once hashed)
+    Returns:
+        total bytes copied
+    """
+    free_buffers = queue.Queue()
+    filled_buffers = queue.Queue()
+    for _ in range(buffers):
+        free_buffers.put(bytearray(length))
+
+    def reader():
+        try:
+            while True:
+                buf = free_buffers.get()
+                # None means the writer has stopped (finished, or failed)
+                if buf is None:
+                    return
+                bytes_read = fsrc.readinto(buf)
+                filled_buffers.put((buf, bytes_read))
+                if not bytes_read:
+                    return
+        except BaseException as e:
+            filled_buffers.put((e, 0))
+
+    reader_thread = threading.Thread(target=reader, name="copy-reader", daemon=True)
+    reader_thread.start()
+    copied = offset
+    try:
+        while True:
+            buf, bytes_read = filled_buffers.get()
+            if isinstance(buf, BaseException):
+                raise buf
+            if not bytes_read:
+                break
+            if hasher is not None:
+                hasher.feed(memoryview(buf)[:bytes_read], done=lambda b=buf: free_buffers.put(b))
+            chunk_start = time.monotonic()
+            fdest.write(memoryview(buf)[:bytes_read])
+            write_seconds = time.monotonic() - chunk_start
+            copied += bytes_read
+            if hasher is None:
+                free_buffers.put(buf)
+            report(bytes_read, copied, write_seconds)
+    finally:
+        free_buffers.put(None)
+        reader_thread.join()
+    return copied
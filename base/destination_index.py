@@ -0,0 +1,86 @@
+""" One walk of a destination drive, instead of stating each file we might copy to it (slow on USB2/exFAT drives) """
+
+import os
+import threading
+import time
+
+from .console import console
+
+
+class DestinationIndex:
+    """
+    The files under each scanned output path (e.g. tv_output_path), by path relative to it -> (size, mtime),
+    from a single recursive os.scandir walk.
+    Paths under no scanned root are just stat'ed.  The index is a snapshot - clear() it once files have been copied.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roots = {}
+
+    def ensure(self, *roots):
+        """
+        Scan any of these output paths that haven't been scanned yet
+        """
+        for root in roots:
+            if not root:
+                continue
+            root = os.path.normpath(root)
+            with self._lock:
+                if root in self._roots:
+                    continue
+            start = time.monotonic()
+            files = _scan(root)
+            with self._lock:
+                self._roots[root] = files
+            console.log(f"Indexed {len(files)} files already on '{root}' in {time.monotonic() - start:.1f}s")
+
+    def clear(self):
+        with self._lock:
+            self._roots = {}
+
+    def lookup(self, path):
+        """
+        Returns (size, mtime) of the file at path, or None if there isn't one
+        """
+        path = os.path.normpath(path)
+        with self._lock:
+            for root, files in self._roots.items():
+                if path.startswith(root + os.sep):
+                    return files.get(path[len(root) + 1:])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def size_of(self, path):
+        """
+        Size of the file at path, or None if there isn't one
+        """
+        found = self.lookup(path)
+        return found[0] if found else None
+
+
+def _scan(root):
+    files = {}
+    folders = [root]
+    prefix_length = len(root) + 1
+    while folders:
+        folder = folders.pop()
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    # Skip just the entry that can't be stat'ed (e.g. a broken symlink, or an I/O error), not the rest of the folder
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            folders.append(entry.path)
+                        else:
+                            stat = entry.stat()
+                            files[entry.path[prefix_length:]] = (stat.st_size, stat.st_mtime)
+                    except OSError:
+                        continue
+        except OSError:
+            # Folders that vanish or can't be read are skipped
+            continue
+    return files
@@ -0,0 +1,136 @@
+""" When (if ever) to fsync copied files - trading safety against throughput """
+
+import os
+import threading
+import time
+
+from .console import console
+
+BYTES_TO_GB_FACTOR = 1024 * 1024 * 1024
+
+
+class DurabilityPolicy:
+    """
+    How hard we try to make sure copied files have actually reached the disk (rather than just the page cache)
+    before carrying on - copy_durability in the subscriber's paths YAML:
+
+    none:    never fsync - fastest, but a crash/unplug can lose recently 'copied' files
+    file:    fsync each file before it is renamed into place (and its folder after) - safest, slowest
+    batch:   fsync the files copied so far every copy_durability_batch_gb of data
+    library: fsync all the files copied at the end of each library (TV, then Movies)
+
+    Also keeps track of the time spent syncing, for report().
+    after_sync, if set, is called (with no arguments) whenever everything completed so far has been synced - the copy
+    journal uses it to only record files once they are safely on disk.
+    """
+
+    POLICIES = ("none", "file", "batch", "library")
+
+    def __init__(self, policy="none", batch_gb=None):
+        self._lock = threading.Lock()
+        self.policy = "none"
+        self.batch_bytes = 0
+        self.seconds = 0.0
+        self.files_synced = 0
+        self._pending = []
+        self._pending_bytes = 0
+        self.after_sync = None
+        self.configure(policy, batch_gb)
+
+    def configure(self, policy, batch_gb=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown durability policy '{policy}' - should be one of {', '.join(self.POLICIES)}")
+        if policy == "batch" and not (batch_gb and batch_gb > 0):
+            raise ValueError(f"Durability policy 'batch' needs copy_durability_batch_gb to be more than 0 (not {batch_gb})")
+        with self._lock:
+            self.policy = policy
+            self.batch_bytes = (batch_gb or 0) * BYTES_TO_GB_FACTOR
+            self.seconds = 0.0
+            self.files_synced = 0
+            self._pending = []
+            self._pending_bytes = 0
+
+    @property
+    def defers_sync(self) -> bool:
+        """
+        Are completed files only synced later (batch/library), rather than before they're in place (file), or never (none)?
+        """
+        return self.policy in ("batch", "library")
+
+    def sync_file(self, fdest):
+        """
+        Called by copy_with_callback once a file has been written, before it is closed & renamed into place.
+        """
+        if self.policy != "file":
+            return
+        start = time.monotonic()
+        fdest.flush()
+        os.fsync(fdest.fileno())
+        with self._lock:
+            self.seconds += time.monotonic() - start
+            self.files_synced += 1
+
+    def file_complete(self, path, nbytes):
+        """
+        Called by copy_with_callback once a file is in place under its final name.
+        """
+        if self.policy == "file":
+            start = time.monotonic()
+            _fsync_folder(os.path.dirname(path))
+            with self._lock:
+                self.seconds += time.monotonic() - start
+        elif self.policy in ("batch", "library"):
+            with self._lock:
+                self._pending.append(path)
+                self._pending_bytes += nbytes
+                if self.policy == "batch" and self._pending_bytes >= self.batch_bytes:
+                    self._sync_pending()
+
+    def end_library(self):
+        """
+        Called at the end of each library - sync anything still pending.
+        """
+        with self._lock:
+            self._sync_pending()
+
+    def _sync_pending(self):
+        # Caller holds self._lock - so no file can complete (& be journaled) between the sync and after_sync
+        if self._pending:
+            start = time.monotonic()
+            for path in self._pending:
+                # fsync only needs a read-only fd, which works even for read-only copies (& hard links to library
+                # files) - but Windows needs write access to flush a file
+                fd = os.open(path, os.O_RDWR | os.O_BINARY if os.name == "nt" else os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            for folder in {os.path.dirname(path) for path in self._pending}:
+                _fsync_folder(folder)
+            self.files_synced += len(self._pending)
+            self._pending = []
+            self._pending_bytes = 0
+            self.seconds += time.monotonic() - start
+        if self.after_sync is not None:
+            self.after_sync()
+
+    def report(self):
+        """
+        Log the time spent syncing under this policy
+        """
+        description = f"every {self.batch_bytes / BYTES_TO_GB_FACTOR:g} GB" if self.policy == "batch" else None
+        console.log(f"Durability policy '{self.policy}'{f' ({description})' if description else ''}: "
+                    f"{self.seconds:.1f}s spent syncing {self.files_synced} file(s) to disk", style="info")
+
+
+def _fsync_folder(folder):
+    """
+    fsync a folder, so renames into it are on disk too (not possible, or needed, on Windows)
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,123 @@
+""" An append-only journal of completed copies, so an interrupted run can pick up where it left off """
+
+import json
+import os
+import threading
+
+from .console import console
+from models.copy_item import CopyItem
+from models.store import store
+
+
+def journal_path(name=None):
+    return f"{store.mediacopier_path}/results/journal.{name or store.name}.jsonl"
+
+
+def load_journal(path=None) -> dict:
+    """
+    Read the journal left by a previous (interrupted) run, if there is one.
+    Returns a dict of destination file -> entry (source, size, mtime, hash).  A partly written last line
+    (i.e. we died mid-write) is ignored.
+    """
+    path = path or journal_path()
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry["destination"]] = entry
+    return entries
+
+
+def journal_confirms(entry: dict, copy_item: CopyItem, need_hash: bool = False) -> bool:
+    """
+    Does this journal entry show copy_item was already copied in full, from the same (unchanged) source file?
+    With need_hash, the copy must also have been hashed (so, with --verify, verified) when it was made.
+    Only meaningful alongside the destination file actually being there at full size - the journal can't know
+    if it has been deleted or changed since.
+    """
+    return (entry is not None
+            and entry["source"] == copy_item.source_file
+            and entry["size"] == copy_item.file_size
+            and copy_item.source_mtime is not None
+            and entry["mtime"] == copy_item.source_mtime
+            and (not need_hash or entry.get("hash") is not None))
+
+
+class CopyJournal:
+    """
+    Appends a line to results/journal.<name>.jsonl as each file is copied.
+    Lines are only written once the file is on disk as far as the durability policy (if given to start()) goes -
+    straight away for 'none' & 'file', otherwise held back until its next batch/library sync.  Each line is flushed
+    as it is written (so survives the process dying), and sync() fsyncs the journal (called along with the
+    durability policy's end of library sync).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._durability = None
+        self._pending = []
+
+    def start(self, path=None, durability=None):
+        with self._lock:
+            if self._file is None:
+                self._file = open(path or journal_path(), "a", encoding="utf-8")
+            self._durability = durability
+        if durability is not None:
+            durability.after_sync = self.flush
+
+    def record(self, copy_item: CopyItem):
+        if self._file is None:
+            return
+        entry = {
+            "source": copy_item.source_file,
+            "destination": copy_item.destination_file,
+            "size": copy_item.file_size,
+            "mtime": copy_item.source_mtime,
+            "hash": getattr(copy_item, '_checksum', None),
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if self._durability is not None and self._durability.defers_sync:
+                self._pending.append(line)
+                return
+            self._file.write(line)
+            self._file.flush()
+
+    def flush(self):
+        """
+        Write out the lines held back for the durability policy's sync - called by it once the sync is done
+        """
+        with self._lock:
+            if self._file is not None and self._pending:
+                self._file.writelines(self._pending)
+                self._file.flush()
+            self._pending = []
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            # (Anything still held back was never synced to disk, so isn't recorded)
+            self._pending = []
+
+
+def clear_journal(path=None):
+    """Delete the copy journal on successful completion."""
+    path = path or journal_path()
+    if os.path.exists(path):
+        try:
+            os.remove(path)
+        except Exception as e:
+            console.log(f"Warning: could not clear copy journal: {e}", style="warning")
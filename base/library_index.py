@@ -0,0 +1,210 @@
+""" A persistent index of the source media libraries, so a folder is only listed again when its mtime has changed """
+
+import json
+import os
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+
+from .console import console
+from .scan import Entry, scan
+
+# (2 - special files are no longer listed)
+INDEX_VERSION = 2
+
+
+class LibraryIndex:
+    """
+    Cached listings of the library folders - for TV, each input path -> its shows -> their seasons -> the episode
+    files - each with the folder's mtime when it was listed.
+    Adding, removing or renaming anything in a folder changes the folder's mtime, so a folder whose mtime is unchanged
+    is served from the index: one stat of the folder instead of listing it and stating everything in it.  A file
+    rewritten in place under the same name (e.g. a downloader writing straight into the library) doesn't change its
+    folder's mtime, so its cached size & mtime can be stale - restat() the files actually being copied before
+    trusting them.
+    Each folder is checked at most once per session.  Thread-safe - scan() checks many folders concurrently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.path = None
+        self._folders = {}
+        self._checked = {}
+        self._dirty = False
+        self.listed = 0
+        self.reused = 0
+
+    def load(self, path):
+        """
+        Load the index saved at path (if there is one) - the folders will be checked against the disk as they're used
+        """
+        folders = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                if saved.get("version") == INDEX_VERSION:
+                    folders = saved["folders"]
+            except (OSError, ValueError, KeyError) as e:
+                console.log(f"Could not load the library index '{path}' ({e}) - starting afresh", style="warning")
+        with self._lock:
+            self.path = path
+            self._folders = folders
+            self._checked = {}
+            self._dirty = False
+            self.listed = 0
+            self.reused = 0
+
+    def save(self):
+        """
+        Write the index back out, if anything in it changed
+        """
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            index = {"version": INDEX_VERSION, "folders": self._folders}
+            temp_path = self.path + ".tmp"
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(temp_path, self.path)
+            self._dirty = False
+        console.log(f"Library index: {self.listed} folder(s) listed, {self.reused} unchanged - saved to '{self.path}'")
+
+    def listing(self, folder) -> list[Entry]:
+        """
+        Everything in folder, sorted by name.
+        Raises FileNotFoundError if folder isn't there (or isn't a folder), much as os.listdir would
+        """
+        entries = self._check(folder)
+        if entries is None:
+            raise FileNotFoundError(f"No such folder: '{folder}'")
+        return entries
+
+    def files(self, folder) -> list[Entry]:
+        """
+        The files (not subfolders) in folder
+        """
+        return [entry for entry in self.listing(folder) if not entry.is_dir]
+
+    def is_dir(self, folder) -> bool:
+        return self._check(folder) is not None
+
+    def scan(self, folders, roots, threads_per_device=1, subfolders=False):
+        """
+        Check (and where needed, list) each of folders concurrently - a pool of threads_per_device threads for each
+        device, so a library spread over several disks is read from all of them at once, rather than one at a time.
+        A folder's device is that of the root (e.g. the tv input path) it is under.
+        With subfolders, each folder's subfolders are checked too (e.g. a show's season folders).
+        Afterwards, listing() and is_dir() answer for these folders from memory.  Errors are left to be raised by them.
+        """
+        root_devices = {}
+        for root in roots:
+            try:
+                root_devices[os.path.join(root, "")] = os.stat(root).st_dev
+            except OSError:
+                continue
+        folders_by_device = {}
+        for folder in folders:
+            under = [root for root in root_devices if os.path.join(folder, "").startswith(root)]
+            device = root_devices[max(under, key=len)] if under else None
+            folders_by_device.setdefault(device, []).append(folder)
+
+        def check(folder):
+            try:
+                entries = self._check(folder)
+                if subfolders and entries:
+                    for entry in entries:
+                        if entry.is_dir:
+                            self._check(entry.path)
+            except OSError:
+                pass
+
+        pools = [ThreadPoolExecutor(max_workers=max(threads_per_device, 1), thread_name_prefix="scan")
+                 for _ in folders_by_device]
+        for pool, device_folders in zip(pools, folders_by_device.values()):
+            for folder in device_folders:
+                pool.submit(check, folder)
+        for pool in pools:
+            pool.shutdown(wait=True)
+
+    def restat(self, copy_items: list) -> list:
+        """
+        Stat the source file of each of copy_items (CopyItems built from the index), bringing its file_size and
+        source_mtime - and the index - up to date if the file has changed in place since its folder was listed.
+        Items whose source file has gone are dropped.
+        Returns the items still there.
+        """
+        kept = []
+        changed = 0
+        for copy_item in copy_items:
+            try:
+                source_stat = os.stat(copy_item.source_file)
+            except OSError:
+                console.log(f"Source file has gone since it was listed: '{copy_item.source_file}'", style="warning")
+                continue
+            if source_stat.st_size != copy_item.file_size or source_stat.st_mtime != copy_item.source_mtime:
+                copy_item.file_size = source_stat.st_size
+                copy_item.source_mtime = source_stat.st_mtime
+                self._update_file(copy_item.source_file, source_stat)
+                changed += 1
+            kept.append(copy_item)
+        if changed:
+            console.log(f"{changed} queued file(s) have changed in place since they were listed - using their current size")
+        return kept
+
+    def _update_file(self, path, file_stat):
+        """
+        Put a file's current size & mtime into its folder's cached listing (if there is one)
+        """
+        folder, name = os.path.split(path)
+        with self._lock:
+            cached = self._folders.get(folder)
+            for record in cached[1] if cached else []:
+                if record[0] == name:
+                    record[2] = file_stat.st_size
+                    record[3] = file_stat.st_mtime
+                    self._dirty = True
+            entries = self._checked.get(folder)
+            for index, entry in enumerate(entries or []):
+                if entry.name == name:
+                    entries[index] = entry._replace(size=file_stat.st_size, mtime=file_stat.st_mtime)
+
+    def _check(self, folder):
+        """
+        The entries in folder - from the index if the folder's mtime is unchanged, otherwise freshly listed -
+        or None if it isn't a folder
+        """
+        with self._lock:
+            if folder in self._checked:
+                return self._checked[folder]
+        try:
+            folder_stat = os.stat(folder)
+        except OSError:
+            folder_stat = None
+        if folder_stat is None or not stat.S_ISDIR(folder_stat.st_mode):
+            with self._lock:
+                self._checked[folder] = None
+                self._dirty |= self._folders.pop(folder, None) is not None
+            return None
+
+        with self._lock:
+            cached = self._folders.get(folder)
+        if cached and cached[0] == folder_stat.st_mtime_ns:
+            entries = [Entry(name, os.path.join(folder, name), is_dir, size, mtime) for name, is_dir, size, mtime in cached[1]]
+            with self._lock:
+                self.reused += 1
+        else:
+            entries = sorted(scan(folder), key=attrgetter("name"))
+            with self._lock:
+                self._folders[folder] = [folder_stat.st_mtime_ns, [[entry.name, entry.is_dir, entry.size, entry.mtime] for entry in entries]]
+                self._dirty = True
+                self.listed += 1
+        with self._lock:
+            self._checked[folder] = entries
+        return entries
+
+
+# Shared by the queue builders - loaded from results/library.index.json when planning starts (see config.load_library_index)
+library_index: LibraryIndex = LibraryIndex()
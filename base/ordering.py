@@ -0,0 +1,134 @@
+""" Order copies to suit spinning source disks - by where each file physically sits, rather than by show/season """
+
+import math
+import os
+import struct
+from dataclasses import dataclass
+
+from models.copy_item import CopyItem
+
+try:
+    import fcntl
+except ImportError:
+    # Windows - no FIEMAP, so inode (file index) order is used
+    fcntl = None
+
+# ioctl(FS_IOC_FIEMAP) - see linux/fiemap.h
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_FLAG_SYNC = 0x01
+_FIEMAP_HEADER = struct.Struct("=QQIIII")
+_FIEMAP_EXTENT = struct.Struct("=QQQQQIIII")
+
+# A simple model of a 7200rpm drive, just for estimating the effect of the ordering
+AVERAGE_SEEK_SECONDS = 0.0085
+ROTATIONAL_LATENCY_SECONDS = 0.0042
+# Gaps smaller than this (in bytes) are read through rather than seeked over
+CONTIGUOUS_GAP_BYTES = 1024 * 1024
+
+
+@dataclass
+class DiskLocation:
+    """ Where a file sits on its device - by physical byte offset (FIEMAP), or failing that, by inode number """
+    device: int
+    start: int
+    end: int
+    physical: bool
+
+
+def physical_offset(path):
+    """
+    The physical byte offset of the first extent of path on its device, via FIEMAP (Linux only).
+    Returns None where FIEMAP isn't available (other platforms, some filesystems, empty files...)
+    """
+    if fcntl is None:
+        return None
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        request = bytearray(_FIEMAP_HEADER.size + _FIEMAP_EXTENT.size)
+        _FIEMAP_HEADER.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, FIEMAP_FLAG_SYNC, 0, 1, 0)
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, request)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    if _FIEMAP_HEADER.unpack_from(request, 0)[3] == 0:
+        return None
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP_HEADER.size)[1]
+
+
+def disk_locations(items: list[CopyItem]) -> dict:
+    """
+    Work out a DiskLocation for each item's source file (one stat, plus one FIEMAP call, per file).
+    Within a device, physical offsets are only used if they are available for every file on it - otherwise
+    inode order is used for that whole device (inode numbers roughly follow allocation order on ext4/XFS/NTFS).
+    Returns a dict of id(item) -> DiskLocation
+    """
+    stats = {}
+    offsets = {}
+    for item in items:
+        stats[id(item)] = os.stat(item.source_file)
+        offsets[id(item)] = physical_offset(item.source_file)
+
+    # (Empty files have no extents, and nothing to read)
+    devices_without_fiemap = {stats[id(item)].st_dev for item in items if offsets[id(item)] is None and stats[id(item)].st_size}
+    locations = {}
+    for item in items:
+        stat = stats[id(item)]
+        if stat.st_dev in devices_without_fiemap:
+            locations[id(item)] = DiskLocation(stat.st_dev, stat.st_ino, stat.st_ino + 1, physical=False)
+        else:
+            offset = offsets[id(item)] or 0
+            locations[id(item)] = DiskLocation(stat.st_dev, offset, offset + stat.st_size, physical=True)
+    return locations
+
+
+def order_for_seeks(items: list[CopyItem], locations: dict = None) -> list[CopyItem]:
+    """
+    Return the items grouped by source device (devices in the order they first appear in the queue), and within
+    each device sorted by physical location, with the destination folder as a secondary key (so files that sit
+    together on the source, e.g. inode order ties, still land folder by folder on the destination).
+    Also records each item's source device (_source_device), so copy_queue doesn't need to stat it again.
+    """
+    if locations is None:
+        locations = disk_locations(items)
+    device_order = {}
+    for item in items:
+        item._source_device = locations[id(item)].device
+        device_order.setdefault(item._source_device, len(device_order))
+    return sorted(items, key=lambda item: (device_order[item._source_device], locations[id(item)].start, item.destination_folder))
+
+
+def estimate_seek_seconds(items: list[CopyItem], locations: dict) -> float:
+    """
+    Estimate the total time spent seeking on the source device(s) if items are read in this order.
+    A jump costs rotational latency plus a seek that grows with the square root of the distance (relative to the
+    span of the files on that device).  Reading on from where the last file on that device ended is free.
+    (Inode order has no real distances - every jump that isn't to the next inode counts as an average seek)
+    """
+    spans = {}
+    for location in locations.values():
+        low, high = spans.get(location.device, (location.start, location.end))
+        spans[location.device] = (min(low, location.start), max(high, location.end))
+
+    seconds = 0.0
+    last_end = {}
+    for item in items:
+        location = locations[id(item)]
+        if location.physical and location.start == location.end:
+            continue
+        previous_end = last_end.get(location.device)
+        last_end[location.device] = location.end
+        if previous_end is None:
+            continue
+        gap = location.start - previous_end
+        if location.physical:
+            if 0 <= gap <= CONTIGUOUS_GAP_BYTES:
+                continue
+            low, high = spans[location.device]
+            seconds += ROTATIONAL_LATENCY_SECONDS + AVERAGE_SEEK_SECONDS * math.sqrt(abs(gap) / max(high - low, 1))
+        elif gap != 0:
+            seconds += ROTATIONAL_LATENCY_SECONDS + AVERAGE_SEEK_SECONDS
+    return seconds
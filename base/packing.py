@@ -0,0 +1,131 @@
+""" When the copy queues won't all fit on the destination drive(s), choose the most valuable subset that does """
+
+import os
+from dataclasses import dataclass, field
+
+from models.copy_item import CopyItem
+
+# Packing priority, highest first.  Artwork (and the other small non-video files) always goes.
+ARTWORK = 0
+# The earliest unwatched season queued for each show - round-robin across the shows, episode by episode
+EARLIEST_SEASON = 1
+# Any newer seasons queued, again round-robin across the shows
+NEWER_SEASONS = 2
+# Specials (Season 00), trailers & other unmatched video files
+EXTRAS = 3
+MOVIES = 4
+
+
+@dataclass
+class PackUnit:
+    """
+    Files that are copied, or deferred, together - an episode (with its subtitles etc.), a movie folder,
+    or a single other file
+    """
+    tier: int
+    device: int
+    items: list = field(default_factory=list)
+    # Bytes this will take up on the destination drive, rounded up to whole clusters
+    size: int = 0
+    # For TV - the show, and the (season, episode) this is
+    show: str = None
+    episode: tuple = None
+    # Position within the tier - e.g. the 3rd episode queued for its show has rank 2
+    rank: int = 0
+    # Tie-break within a rank - the order the units were queued in
+    order: int = 0
+
+    @property
+    def label(self):
+        if self.episode:
+            return f"{self.show} S{self.episode[0]:02d}E{self.episode[1]:02d}"
+        if self.tier == MOVIES:
+            return os.path.basename(self.items[0].source_folder)
+        return self.items[0].file_name
+
+
+def size_on_disk(nbytes, cluster_size):
+    """ The space nbytes will actually take on the disk - a whole number of clusters """
+    return -(-nbytes // cluster_size) * cluster_size
+
+
+def tv_units(queue: list[CopyItem], device: int, video_file_extensions) -> list[PackUnit]:
+    """
+    Group a tv copy queue into PackUnits - one per episode, one per other file
+    """
+    units = {}
+    for order, item in enumerate(queue):
+        if item.wanted_show and item.episode is not None:
+            key = (item.wanted_show, item.season, item.episode)
+            if key not in units:
+                units[key] = PackUnit(tier=EXTRAS if item.season == 0 else EARLIEST_SEASON, device=device,
+                                      show=item.wanted_show, episode=(item.season, item.episode), order=order)
+        else:
+            is_video = os.path.splitext(item.file_name)[1].lower() in video_file_extensions
+            key = (None, order)
+            units[key] = PackUnit(tier=EXTRAS if is_video else ARTWORK, device=device, order=order)
+        units[key].items.append(item)
+
+    # Rank each show's episodes, earliest first, and move those beyond its earliest queued season down a tier
+    episodes_by_show = {}
+    for unit in units.values():
+        if unit.episode and unit.episode[0] > 0:
+            episodes_by_show.setdefault(unit.show, []).append(unit)
+    for episodes in episodes_by_show.values():
+        episodes.sort(key=lambda unit: unit.episode)
+        earliest_season = episodes[0].episode[0]
+        for rank, unit in enumerate(episodes):
+            unit.rank = rank
+            if unit.episode[0] != earliest_season:
+                unit.tier = NEWER_SEASONS
+    return list(units.values())
+
+
+def movie_units(queue: list[CopyItem], device: int) -> list[PackUnit]:
+    """
+    Group a movie copy queue into PackUnits - one per movie folder
+    """
+    units = {}
+    for order, item in enumerate(queue):
+        if item.source_folder not in units:
+            units[item.source_folder] = PackUnit(tier=MOVIES, device=device, order=order)
+        units[item.source_folder].items.append(item)
+    return list(units.values())
+
+
+def pack(units: list[PackUnit], free_bytes: dict) -> tuple[list[PackUnit], list[PackUnit]]:
+    """
+    Fill each destination device's free space (free_bytes: device -> bytes) with units, highest priority first.
+    A unit that doesn't fit is deferred - and so is everything after it from the same show, so no gaps are
+    left in anyone's episodes.  Smaller, lower priority units may still fit in what's left.
+    Returns (kept, deferred), each in priority order.
+    """
+    free_bytes = dict(free_bytes)
+    kept = []
+    deferred = []
+    deferred_shows = set()
+    for unit in sorted(units, key=lambda unit: (unit.tier, unit.rank, unit.order)):
+        if unit.tier != ARTWORK and (unit.show in deferred_shows or unit.size > free_bytes[unit.device]):
+            deferred.append(unit)
+            if unit.show:
+                deferred_shows.add(unit.show)
+            continue
+        free_bytes[unit.device] -= unit.size
+        kept.append(unit)
+    return kept, deferred
+
+
+def episodes_to_resume_after(kept: list[PackUnit], deferred: list[PackUnit]) -> dict:
+    """
+    For each show with deferred (numbered season) episodes: show -> the last (season, episode) being copied
+    before them, or None if none of its episodes are being copied
+    """
+    first_deferred = {}
+    for unit in deferred:
+        if unit.episode and unit.episode[0] > 0:
+            first_deferred[unit.show] = min(unit.episode, first_deferred.get(unit.show, unit.episode))
+    resume_after = {show: None for show in first_deferred}
+    for unit in kept:
+        if unit.show in first_deferred and unit.episode and 0 < unit.episode[0] and unit.episode < first_deferred[unit.show]:
+            resume_after[unit.show] = max(unit.episode, resume_after[unit.show] or unit.episode)
+    return resume_after
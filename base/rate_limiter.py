@@ -0,0 +1,200 @@
+""" A token bucket rate limiter, shared by all the copy streams so a speed limit holds across a whole session """
+
+import threading
+import time
+
+from .console import console
+
+BYTES_PER_MB = 1024 * 1024
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.  Tokens are bytes, refilled continuously at rate_mbps, up to burst_mb.
+
+    Callers consume() the bytes they have just copied - the bucket is allowed to go into debt, and the
+    caller then sleeps until the debt is paid off.  So one large chunk (bigger than the burst) is fine, and
+    with several streams sharing the bucket, each waits its turn and the total rate holds.
+
+    A rate of None means unlimited (consume() returns immediately).  The rate can be changed at any time.
+    """
+
+    def __init__(self, rate_mbps=None, burst_mb=None):
+        self._lock = threading.Lock()
+        self._rate = None
+        self._capacity = 0
+        self._burst = None
+        self._tokens = 0.0
+        self._last_refill = time.monotonic()
+        self.set_rate(rate_mbps, burst_mb)
+
+    @property
+    def rate_mbps(self):
+        return self._rate / BYTES_PER_MB if self._rate else None
+
+    def set_rate(self, rate_mbps, burst_mb=None):
+        """
+        Change the rate (MB/s, or None for unlimited) and, optionally, the burst size (MB).
+        Without a burst, any burst set before is kept - otherwise it is one second's worth of the rate.
+        """
+        with self._lock:
+            self._refill()
+            was_limited = self._rate is not None
+            self._rate = rate_mbps * BYTES_PER_MB if rate_mbps else None
+            if burst_mb:
+                self._burst = burst_mb * BYTES_PER_MB
+            if self._burst:
+                self._capacity = self._burst
+            elif self._rate:
+                self._capacity = self._rate
+            # Start a newly enabled limit with a full bucket
+            self._tokens = min(self._tokens, self._capacity) if was_limited else self._capacity
+
+    def consume(self, nbytes, cancelled: threading.Event = None) -> float:
+        """
+        Take nbytes from the bucket, sleeping as needed to stay within the rate.
+        If cancelled is given, the sleep ends early once it is set.
+        Returns the number of seconds spent waiting.
+        """
+        with self._lock:
+            if not self._rate:
+                return 0.0
+            self._refill()
+            self._tokens -= nbytes
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            if cancelled is not None:
+                cancelled.wait(wait)
+            else:
+                time.sleep(wait)
+        return wait
+
+    def observe(self, nbytes, seconds):
+        """
+        Copies report how long each write took here - a plain TokenBucket doesn't care.
+        """
+        pass
+
+    def _refill(self):
+        now = time.monotonic()
+        if self._rate:
+            self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    A TokenBucket that, when adaptive mode is on, sets its own rate from the write throughput the copies report
+    via observe() - to ride the SLC cache of QLC drives (e.g. the Crucial X9) at full speed, rather than
+    applying a static limit up front.
+
+    Throughput is measured over windows of WINDOW_BYTES (the copies flush to disk once per window, see
+    sync_interval_bytes, so the page cache can't hide the drive's real speed).  Then:
+    - Full speed: if throughput falls under CLIFF_FRACTION of the (slowly decaying) peak for CLIFF_WINDOWS windows
+      in a row, we've fallen off the SLC cache cliff - back off to a sustainable rate (copy_speed_limit_mbps if
+      configured, otherwise a little under the throughput just measured) and hold there for a while.
+    - Once the hold is over, probe: raise the rate by RAMP_FACTOR each window, lifting the limit entirely once
+      it passes the peak.  If the drive can't keep up with (KEEP_UP_FRACTION of) the probe rate, it hasn't recovered yet - back off
+      again, and hold for twice as long next time.
+    """
+
+    WINDOW_BYTES = 1024 * BYTES_PER_MB
+    CLIFF_FRACTION = 0.5
+    CLIFF_WINDOWS = 2
+    PEAK_DECAY = 0.95
+    SUSTAINABLE_FRACTION = 0.9
+    HOLD_SECONDS = 300
+    MAX_HOLD_SECONDS = 3600
+    RAMP_FACTOR = 1.5
+    KEEP_UP_FRACTION = 0.9
+
+    def __init__(self, rate_mbps=None, burst_mb=None):
+        super().__init__(rate_mbps, burst_mb)
+        self.adaptive = False
+        self.sustainable_mbps = None
+        self._observe_lock = threading.Lock()
+        self._reset_adaptive_state()
+
+    def _reset_adaptive_state(self):
+        self._window_bytes = 0
+        self._window_seconds = 0.0
+        self._peak = 0.0
+        self._slow_windows = 0
+        self._hold_seconds = self.HOLD_SECONDS
+        self._hold_until = None
+        self._ramping = False
+
+    @property
+    def sync_interval_bytes(self):
+        return self.WINDOW_BYTES if self.adaptive else None
+
+    def set_adaptive(self, enabled, sustainable_mbps=None, burst_mb=None):
+        """
+        Turn adaptive mode on (starting at full speed) or off (leaving the rate unlimited).
+        sustainable_mbps, if given, is the rate to back off to when the cliff is detected, and burst_mb the burst
+        to allow whenever the rate is limited.
+        """
+        with self._observe_lock:
+            self.adaptive = enabled
+            self.sustainable_mbps = sustainable_mbps
+            self._reset_adaptive_state()
+        self.set_rate(None, burst_mb)
+
+    def observe(self, nbytes, seconds):
+        if not self.adaptive:
+            return
+        with self._observe_lock:
+            self._window_bytes += nbytes
+            self._window_seconds += seconds
+            if self._window_bytes < self.WINDOW_BYTES:
+                return
+            throughput_mbps = self._window_bytes / BYTES_PER_MB / max(self._window_seconds, 1e-6)
+            self._window_bytes = 0
+            self._window_seconds = 0.0
+            self._end_of_window(throughput_mbps)
+
+    def _end_of_window(self, throughput_mbps):
+        rate = self.rate_mbps
+        now = time.monotonic()
+
+        # Full speed - watch for the cliff
+        if rate is None:
+            self._peak = max(throughput_mbps, self._peak * self.PEAK_DECAY)
+            self._slow_windows = self._slow_windows + 1 if throughput_mbps < self._peak * self.CLIFF_FRACTION else 0
+            if self._slow_windows >= self.CLIFF_WINDOWS:
+                self._back_off(throughput_mbps, now)
+            return
+
+        # Backed off - wait out the hold before probing
+        if not self._ramping:
+            if now >= self._hold_until:
+                self._ramping = True
+                self._ramp(rate)
+            return
+
+        # Probing - did the drive keep up?
+        if throughput_mbps < rate * self.KEEP_UP_FRACTION:
+            self._hold_seconds = min(self._hold_seconds * 2, self.MAX_HOLD_SECONDS)
+            self._back_off(throughput_mbps, now)
+        else:
+            self._ramp(rate)
+
+    def _back_off(self, throughput_mbps, now):
+        sustainable_mbps = self.sustainable_mbps or max(throughput_mbps * self.SUSTAINABLE_FRACTION, 1)
+        self._slow_windows = 0
+        self._ramping = False
+        self._hold_until = now + self._hold_seconds
+        self.set_rate(sustainable_mbps)
+        console.log(f"Write speed dropped to {throughput_mbps:.0f} MB/s (peak {self._peak:.0f} MB/s) - "
+                    f"SLC cache likely exhausted, limiting to {sustainable_mbps:.0f} MB/s for {self._hold_seconds / 60:.0f} min", style="warning")
+
+    def _ramp(self, rate):
+        new_rate = rate * self.RAMP_FACTOR
+        if new_rate >= self._peak:
+            self._ramping = False
+            self._hold_seconds = self.HOLD_SECONDS
+            self.set_rate(None)
+            console.log("Drive has recovered - speed limit lifted", style="info")
+        else:
+            self.set_rate(new_rate)
+            console.log(f"Probing drive recovery - speed limit raised to {new_rate:.0f} MB/s", style="info")
@@ -0,0 +1,70 @@
+""" Folder scanning on os.scandir - compact records of each entry, from (at most) one stat per entry """
+
+import os
+import stat
+from collections import namedtuple
+
+# One folder or (regular) file in a folder.  is_dir, size & mtime follow symlinks, as os.path.isdir/getsize/getmtime do.
+# size & mtime are None if scanned without with_stat.
+Entry = namedtuple("Entry", "name path is_dir size mtime")
+
+
+def _entry(dir_entry: os.DirEntry, with_stat) -> Entry:
+    """ The Entry for dir_entry - or None if it's neither a folder nor a regular file (a FIFO, socket, device...) """
+    if not with_stat:
+        # From the folder listing itself (d_type), where the filesystem provides it - no stat at all
+        is_dir = dir_entry.is_dir()
+        if not is_dir and not dir_entry.is_file():
+            return None
+        return Entry(dir_entry.name, dir_entry.path, is_dir, None, None)
+    # On Windows, scandir already has this, so there's no call at all
+    entry_stat = dir_entry.stat()
+    if not stat.S_ISDIR(entry_stat.st_mode) and not stat.S_ISREG(entry_stat.st_mode):
+        return None
+    return Entry(dir_entry.name, dir_entry.path, stat.S_ISDIR(entry_stat.st_mode), entry_stat.st_size, entry_stat.st_mtime)
+
+
+def scan(folder, with_stat=True):
+    """
+    Yield an Entry for each thing in folder, in no particular order.
+    With with_stat, each entry is stat'ed once for its size & mtime.  Without, this is as cheap as os.listdir.
+    Only folders & regular files are yielded - special files (FIFOs, sockets, devices), and entries that can't be
+    stat'ed (e.g. broken symlinks), are skipped.
+    Raises FileNotFoundError etc. as os.scandir does.
+    """
+    with os.scandir(folder) as dir_entries:
+        for dir_entry in dir_entries:
+            try:
+                entry = _entry(dir_entry, with_stat)
+            except OSError:
+                continue
+            if entry is not None:
+                yield entry
+
+
+def scan_tree(folder, with_stat=True, hidden=True):
+    """
+    Yield an Entry for everything under folder, recursively - one os.scandir per folder, each folder before the
+    things in it (as os.walk, top down).  Symlinked folders are listed but not followed into.
+    Without hidden, names starting with '.' are skipped (as glob does).  As for scan(), special files are skipped.
+    Folders that vanish or can't be read are skipped.
+    """
+    folders = [folder]
+    while folders:
+        current = folders.pop()
+        try:
+            with os.scandir(current) as dir_entries:
+                for dir_entry in dir_entries:
+                    if not hidden and dir_entry.name.startswith('.'):
+                        continue
+                    try:
+                        entry = _entry(dir_entry, with_stat)
+                    except OSError:
+                        continue
+                    if entry is None:
+                        continue
+                    yield entry
+                    if entry.is_dir and not dir_entry.is_symlink():
+                        folders.append(entry.path)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
@@ -0,0 +1,187 @@
+""" Per-file copy metrics, with per-library and per-device totals - written out as JSON at the end of a session """
+
+import bisect
+import json
+import os
+import threading
+import time
+
+from .console import console
+
+BYTES_PER_MB = 1024 * 1024
+# Upper bounds (ms) of the write latency histogram buckets - the last bucket is everything slower
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+def _latency_histogram():
+    return [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+def _bucket_labels():
+    return [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class FileStats:
+    """
+    The metrics for one file being copied - the copy loops call record_chunk() for each chunk written
+    (see copy_with_callback's stats)
+    """
+
+    def __init__(self, name, size, library, source_device, destination_device):
+        self.name = name
+        self.size = size
+        self.library = library
+        self.source_device = source_device
+        self.destination_device = destination_device
+        self.bytes = 0
+        self.throttled_seconds = 0.0
+        self.write_latencies = []
+        self.started = time.monotonic()
+        self.wall_seconds = None
+
+    def record_chunk(self, nbytes, write_seconds, throttled_seconds=0.0):
+        self.bytes += nbytes
+        self.write_latencies.append(write_seconds)
+        self.throttled_seconds += throttled_seconds
+
+    def finish(self):
+        self.wall_seconds = time.monotonic() - self.started
+
+    def histogram(self):
+        counts = _latency_histogram()
+        for seconds in self.write_latencies:
+            counts[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        return counts
+
+    def as_dict(self):
+        latencies = sorted(self.write_latencies)
+        return {
+            "name": self.name,
+            "library": self.library,
+            "source_device": self.source_device,
+            "destination_device": self.destination_device,
+            "size": self.size,
+            "bytes": self.bytes,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "mb_per_second": round(self.bytes / BYTES_PER_MB / self.wall_seconds, 1) if self.wall_seconds else None,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "writes": len(latencies),
+            "write_ms": {
+                "p50": _ms(_percentile(latencies, 0.5)),
+                "p95": _ms(_percentile(latencies, 0.95)),
+                "p99": _ms(_percentile(latencies, 0.99)),
+                "max": _ms(latencies[-1] if latencies else None),
+            },
+        }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class _Totals:
+    """ Running totals for a group of files (a library, or a device) """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.wall_seconds = 0.0
+        self.throttled_seconds = 0.0
+        self.latency_histogram = _latency_histogram()
+
+    def add(self, file_stats: FileStats):
+        self.files += 1
+        self.bytes += file_stats.bytes
+        self.wall_seconds += file_stats.wall_seconds
+        self.throttled_seconds += file_stats.throttled_seconds
+        for bucket, count in enumerate(file_stats.histogram()):
+            self.latency_histogram[bucket] += count
+
+    @property
+    def mb_per_second(self):
+        return self.bytes / BYTES_PER_MB / self.wall_seconds if self.wall_seconds else None
+
+    def as_dict(self):
+        return {
+            "files": self.files,
+            "bytes": self.bytes,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "mb_per_second": round(self.mb_per_second, 1) if self.mb_per_second else None,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "write_latency_histogram": dict(zip(_bucket_labels(), self.latency_histogram)),
+        }
+
+
+class CopyTelemetry:
+    """
+    Collects FileStats for a session, keeping totals per library and per device (source and destination devices,
+    named by their mount point).  Thread-safe - files may be copied in parallel.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mount_points = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.files = []
+            self.libraries = {}
+            self.devices = {}
+            self.started = time.time()
+
+    def start_file(self, name, size, library, source_file, destination_folder) -> FileStats:
+        return FileStats(name, size, library, self._mount_point(os.path.dirname(source_file)), self._mount_point(destination_folder))
+
+    def finish_file(self, file_stats: FileStats):
+        file_stats.finish()
+        with self._lock:
+            self.files.append(file_stats.as_dict())
+            self.libraries.setdefault(file_stats.library, _Totals()).add(file_stats)
+            self.devices.setdefault(f"source {file_stats.source_device}", _Totals()).add(file_stats)
+            self.devices.setdefault(f"destination {file_stats.destination_device}", _Totals()).add(file_stats)
+        # The per-file latencies are summarised in files & totals now
+        file_stats.write_latencies = []
+
+    def _mount_point(self, folder):
+        with self._lock:
+            if folder in self._mount_points:
+                return self._mount_points[folder]
+        path = os.path.abspath(folder)
+        while not os.path.exists(path) or not os.path.ismount(path):
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+        with self._lock:
+            self._mount_points[folder] = path
+        return path
+
+    def report(self):
+        """
+        Log a line per library & device - MB/s, and time spent throttled
+        """
+        for heading, groups in (("Library", self.libraries), ("Device", self.devices)):
+            for name, totals in groups.items():
+                console.log(f"{heading} [dodger_blue1]{name}[/dodger_blue1]: {totals.files} file(s), {totals.bytes / BYTES_PER_MB / 1024:.2f} GB "
+                            f"at {totals.mb_per_second or 0:.1f} MB/s ({totals.throttled_seconds:.0f}s throttled)", style="info")
+
+    def write(self, path):
+        with self._lock:
+            session = {
+                "started": self.started,
+                "latency_buckets_ms": LATENCY_BUCKETS_MS,
+                "libraries": {name: totals.as_dict() for name, totals in self.libraries.items()},
+                "devices": {name: totals.as_dict() for name, totals in self.devices.items()},
+                "files": self.files,
+            }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(session, f, indent=2)
+        console.log(f"Wrote copy telemetry to '{path}'")
@@ -1,24 +1,73 @@
 import ctypes
-import glob
 import os
 import platform
 import re
 import shutil
+import stat
 
 from .console import console
+from .scan import Entry, scan, scan_tree
 from models.store import store
 
 
 # Mimic an os.DirEntry so functions below return more uniformly
 # https://stackoverflow.com/a/57439730/4599061
 class PseudoDirEntry:
+    """
+    Each attribute is only worked out when first asked for, then kept - most callers only ever want .name.
+    Build one with from_entry() to reuse what a scan (base/scan.py) already found out.
+    """
+    __slots__ = ("_given_path", "_path", "_name", "_is_dir", "_mtime", "_stat")
+
     def __init__(self, path):
-        import os, os.path
-        self.path = os.path.realpath(path)
-        self.name = os.path.basename(self.path)
-        self.is_dir = os.path.isdir(self.path)
-        self.stat = lambda: os.stat(self.path)
-        self.mtime = os.path.getmtime(self.path)
+        self._given_path = path
+        self._path = None
+        self._name = None
+        self._is_dir = None
+        self._mtime = None
+        self._stat = None
+
+    @classmethod
+    def from_entry(cls, entry: Entry):
+        pseudo_dir_entry = cls(entry.path)
+        pseudo_dir_entry._name = entry.name
+        pseudo_dir_entry._is_dir = entry.is_dir
+        pseudo_dir_entry._mtime = entry.mtime
+        return pseudo_dir_entry
+
+    @property
+    def path(self):
+        """ The real path (symlinks resolved) """
+        if self._path is None:
+            self._path = os.path.realpath(self._given_path)
+        return self._path
+
+    @property
+    def name(self):
+        """ The last part of the path it was found at - e.g. 'Season 01' for 'Show/Season 01/' """
+        if self._name is None:
+            self._name = os.path.basename(self._given_path.rstrip(os.sep + (os.altsep or "")))
+        return self._name
+
+    @property
+    def is_dir(self):
+        if self._is_dir is None:
+            try:
+                self._is_dir = stat.S_ISDIR(self.stat().st_mode)
+            except OSError:
+                self._is_dir = False
+        return self._is_dir
+
+    @property
+    def mtime(self):
+        if self._mtime is None:
+            self._mtime = self.stat().st_mtime
+        return self._mtime
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self._given_path)
+        return self._stat
 
 
 def subfolders_of_path(path):
@@ -28,7 +77,7 @@ def subfolders_of_path(path):
     :param path:
     :return: list: a list of the immediate subfolders of a given path (f.path and f.name)
     """
-    return [f for f in os.scandir(path) if f.is_dir()]
+    return [entry for entry in scan(path, with_stat=False) if entry.is_dir]
 
 
 def subfolders_of_path_recursive(path):
@@ -38,10 +87,11 @@ def subfolders_of_path_recursive(path):
     :param path:
     :return: [PseudoDirEntry] list of PseudoDirEntry of subfolders for the given path
     """
-    folders = glob.glob(f"{path}/**/", recursive=True)
-    temp = []
-    for folder in folders:
-        temp.append(PseudoDirEntry(folder))
+    # Parents before their subfolders, starting with path itself (as glob's "path/**/" gave)
+    temp = [PseudoDirEntry(path)]
+    for entry in scan_tree(path, with_stat=False, hidden=False):
+        if entry.is_dir:
+            temp.append(PseudoDirEntry.from_entry(entry))
     return temp
 
 
@@ -49,16 +99,15 @@ def video_files_in_path_recursive(path):
     """
     Using the list of video file extensions from the store, recursively find and return a list of all video files as PseudoDirEntry objects
     (equivalent to os.DirEntry).
-    Uses a single os.walk pass rather than one glob per extension for efficiency.
+    Uses a single scan of the tree rather than one glob per extension for efficiency.
     :param path:
     :return: [PseudoDirEntry] list of PseudoDirEntry of video files (f.name, f.path etc)
     """
     extensions = set(store.video_file_extensions)
     temp = []
-    for dirpath, _dirnames, filenames in os.walk(path):
-        for filename in filenames:
-            if os.path.splitext(filename)[1].lower() in extensions:
-                temp.append(PseudoDirEntry(os.path.join(dirpath, filename)))
+    for entry in scan_tree(path, with_stat=False):
+        if not entry.is_dir and os.path.splitext(entry.name)[1].lower() in extensions:
+            temp.append(PseudoDirEntry.from_entry(entry))
     return temp
 
 
@@ -69,15 +118,13 @@ def sxxexx_video_files_in_path(path, sxxexx):
     is a prefix of a longer one (e.g. S05E10 matching S05E100).
     The pattern requires that sxxexx is not immediately followed by another digit.
     """
-    # Collect all video files under path first, then filter with regex
-    all_video_files = []
-    for file_ext in store.video_file_extensions:
-        all_video_files.extend(glob.glob(f"{path}/**/*{file_ext}", recursive=True))
+    # One scan of the tree for the video files (skipping hidden ones, as the globs this replaced did), filtered with regex
+    extensions = set(store.video_file_extensions)
     pattern = re.compile(re.escape(sxxexx) + r'(?![0-9])', re.IGNORECASE)
     temp = []
-    for video in all_video_files:
-        if pattern.search(os.path.basename(video)):
-            temp.append(PseudoDirEntry(video))
+    for entry in scan_tree(path, with_stat=False, hidden=False):
+        if not entry.is_dir and os.path.splitext(entry.name)[1] in extensions and pattern.search(entry.name):
+            temp.append(PseudoDirEntry.from_entry(entry))
     return temp
 
 
@@ -87,7 +134,7 @@ def list_of_folder_contents_as_paths(d):
     i.e. like os.listdir, but with full paths returned
 
     """
-    return [os.path.join(d, f) for f in sorted(os.listdir(d))]
+    return sorted(entry.path for entry in scan(d, with_stat=False))
 
 
 def list_of_files(path):
@@ -95,8 +142,7 @@ def list_of_files(path):
     List only the files in a folder, not subdirectories
     Returns a list of files *with full paths*
     """
-    return [os.path.join(path, filename) for filename in os.listdir(path)
-            if os.path.isfile(os.path.join(path, filename))]
+    return [entry.path for entry in scan(path, with_stat=False) if not entry.is_dir]
 
 
 def copy_folder(src, dst):
@@ -112,12 +158,7 @@ def folder_size_in_bytes(start_path='.'):
     Get size of dir e.g. to check it all copied OK
     Returns size in bytes
     """
-    total_size = 0
-    for dir_path, dir_names, filenames in os.walk(start_path):
-        for f in filenames:
-            fp = os.path.join(dir_path, f)
-            total_size += os.path.getsize(fp)
-    return total_size
+    return sum(entry.size for entry in scan_tree(start_path) if not entry.is_dir)
 
 
 def free_space_in_bytes(folder):
@@ -136,6 +177,24 @@ def free_space_in_bytes(folder):
         return st.f_bavail * st.f_frsize
 
 
+def cluster_size_in_bytes(folder):
+    """
+    Return the allocation unit (cluster/fragment size) of folder's filesystem - every file takes up a whole
+    number of these on the disk.  Cross-platform; falls back to 4096 if it can't be found.
+    """
+    if platform.system() == 'Windows':
+        sectors_per_cluster = ctypes.c_ulong(0)
+        bytes_per_sector = ctypes.c_ulong(0)
+        drive = os.path.splitdrive(os.path.abspath(folder))[0] + "\\"
+        if ctypes.windll.kernel32.GetDiskFreeSpaceW(ctypes.c_wchar_p(drive), ctypes.pointer(sectors_per_cluster),
+                                                    ctypes.pointer(bytes_per_sector), None, None):
+            return sectors_per_cluster.value * bytes_per_sector.value or 4096
+        return 4096
+    else:
+        st = os.statvfs(folder)
+        return st.f_frsize or st.f_bsize or 4096
+
+
 def free_space_in_gigabytes(folder):
     """
     Return folder/drive free space (in gigabytes)
@@ -0,0 +1,100 @@
+"""
+Benchmark copy ordering on a source library: queue order (as create_tv_copy_queue builds it - show by show, folder
+by folder) vs. disk location order (base/ordering.py).
+
+Usage (from the repo root):
+    python -m benchmarks.copy_ordering <source folder> [--read]
+
+Reports the estimated seek time for each order.  With --read, also actually reads every file in each order
+(dropping them from the page cache first, so it is the disk being measured) - do this on a spinning disk to see
+the real difference.  Without a source folder, a synthetic one is created (written in shuffled order, so its
+files are scattered on the disk).
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from base.ordering import disk_locations, estimate_seek_seconds, order_for_seeks
+from models.copy_item import CopyItem
+
+SYNTHETIC_SHOWS = 20
+SYNTHETIC_EPISODES = 20
+SYNTHETIC_FILE_SIZE = 2 * 1024 * 1024
+READ_BUFFER = 16 * 1024 * 1024
+
+
+def queue_for_folder(source_folder, destination_folder="/destination"):
+    """ CopyItems for every file under source_folder, in the order the copy queue builders would produce """
+    items = []
+    for dir_path, dir_names, file_names in os.walk(source_folder):
+        dir_names.sort()
+        relative = os.path.relpath(dir_path, source_folder)
+        for file_name in sorted(file_names):
+            source_file = os.path.join(dir_path, file_name)
+            items.append(CopyItem(file_name=file_name,
+                                  file_size=os.path.getsize(source_file),
+                                  source_folder=dir_path,
+                                  destination_folder=os.path.join(destination_folder, relative),
+                                  source_file=source_file,
+                                  destination_file=os.path.join(destination_folder, relative, file_name)))
+    return items
+
+
+def make_synthetic_library(root):
+    """ Shows/Season folders of episodes, written in random order so queue order jumps around the disk """
+    paths = [os.path.join(root, f"Show {show:02d}", "Season 01", f"Show {show:02d} - S01E{episode:02d}.mkv")
+             for show in range(SYNTHETIC_SHOWS) for episode in range(1, SYNTHETIC_EPISODES + 1)]
+    random.shuffle(paths)
+    for path in paths:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(os.urandom(SYNTHETIC_FILE_SIZE))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_in_order(items):
+    """ Read every file, uncached where possible - returns seconds taken """
+    for item in items:
+        with open(item.source_file, "rb") as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    start = time.monotonic()
+    for item in items:
+        with open(item.source_file, "rb", buffering=0) as f:
+            while f.read(READ_BUFFER):
+                pass
+    return time.monotonic() - start
+
+
+def main(args):
+    read = "--read" in args
+    folders = [arg for arg in args if not arg.startswith("--")]
+    with tempfile.TemporaryDirectory() as scratch:
+        if folders:
+            source_folder = folders[0]
+        else:
+            source_folder = scratch
+            print(f"Creating a synthetic library of {SYNTHETIC_SHOWS * SYNTHETIC_EPISODES} files in {scratch}...")
+            make_synthetic_library(scratch)
+
+        queue = queue_for_folder(source_folder)
+        start = time.monotonic()
+        locations = disk_locations(queue)
+        ordered = order_for_seeks(queue, locations)
+        ordering_seconds = time.monotonic() - start
+        physical = all(location.physical for location in locations.values())
+
+        print(f"{len(queue)} files, located by {'physical offset (FIEMAP)' if physical else 'inode number'} "
+              f"in {ordering_seconds:.3f}s")
+        print(f"Estimated seek time - queue order: {estimate_seek_seconds(queue, locations):.2f}s, "
+              f"disk order: {estimate_seek_seconds(ordered, locations):.2f}s")
+        if read:
+            print(f"Read time - queue order: {read_in_order(queue):.2f}s, disk order: {read_in_order(ordered):.2f}s")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,70 @@
+"""
+Benchmark the cost of a progress callback per copied chunk: CopyProgress's counter based callbacks (flushed to rich
+at the refresh rate) vs. updating the rich progress bars directly on every chunk, as it used to.
+
+Usage (from the repo root):
+    python -m benchmarks.progress_overhead [chunks]
+
+Nothing is displayed - this measures just the bookkeeping a copy loop pays for, per chunk.
+"""
+
+import sys
+import time
+
+from progress.copy_progress import CopyProgress
+
+DEFAULT_CHUNKS = 200_000
+CHUNK_BYTES = 1024 * 1024
+# Flushes per benchmark run - i.e. roughly what Live's refresh would do over a real copy of that many chunks
+FLUSHES = 100
+
+
+def make_progress(chunks):
+    progress = CopyProgress()
+    progress.prep_overall_progress(chunks * CHUNK_BYTES)
+    progress.prep_library_progress("TV Shows", chunks * CHUNK_BYTES)
+    task = progress.add_file("benchmark.mkv", chunks * CHUNK_BYTES)
+    return progress, task
+
+
+def direct_updates(chunks):
+    """ The old way - three rich Progress.update calls per chunk """
+    progress, task = make_progress(chunks)
+
+    def callback(bytes_since_last_update, total_bytes_copied, size):
+        progress.current_file.update(task, advance=bytes_since_last_update)
+        progress.overall.update(progress.overall_task, advance=bytes_since_last_update)
+        progress.overall.update(progress.current_library_task, advance=bytes_since_last_update)
+
+    start = time.perf_counter()
+    for chunk in range(chunks):
+        callback(CHUNK_BYTES, chunk * CHUNK_BYTES, chunks * CHUNK_BYTES)
+    return time.perf_counter() - start, progress.current_file.tasks[0].completed
+
+
+def coalesced_updates(chunks):
+    """ CopyProgress.file_callback - an integer add per chunk, plus the occasional flush """
+    progress, task = make_progress(chunks)
+    callback = progress.file_callback(task)
+    flush_every = max(chunks // FLUSHES, 1)
+
+    start = time.perf_counter()
+    for chunk in range(chunks):
+        callback(CHUNK_BYTES, chunk * CHUNK_BYTES, chunks * CHUNK_BYTES)
+        if chunk % flush_every == 0:
+            progress.flush()
+    progress.flush()
+    return time.perf_counter() - start, progress.current_file.tasks[0].completed
+
+
+def main(args):
+    chunks = int(args[0]) if args else DEFAULT_CHUNKS
+    print(f"{chunks} chunks of {CHUNK_BYTES // 1024} KB")
+    for label, benchmark in (("direct rich updates", direct_updates), ("coalesced counters", coalesced_updates)):
+        seconds, completed = benchmark(chunks)
+        assert completed == chunks * CHUNK_BYTES, f"{label} lost progress: {completed}"
+        print(f"{label:>20}: {seconds:.3f}s total, {seconds / chunks * 1e9:,.0f} ns per chunk")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,143 @@
+"""
+Benchmark folder scanning: base/scan.py (os.scandir, at most one stat per entry) vs. the os.listdir / os.path.isfile /
+os.path.getsize / glob based helpers base/utils.py and the queue builders used before.
+
+Usage (from the repo root):
+    python -m benchmarks.scan_tree [folder] [--files N]
+
+Without a folder, a synthetic library of N (default 100,000) empty episode files is created - shows of seasons of
+episodes, plus some artwork.  Each approach is timed over the same tree, warm (the tree will be in the page cache
+after the first pass, so this measures the syscalls, not the disk).
+"""
+
+import glob
+import os
+import sys
+import tempfile
+import time
+
+from base.scan import scan, scan_tree
+from models.store import store
+
+DEFAULT_FILES = 100_000
+SEASONS_PER_SHOW = 10
+EPISODES_PER_SEASON = 20
+ROUNDS = 3
+
+
+def make_synthetic_library(root, files):
+    """ Show NNNN/Season NN/Show NNNN - SxxEyy.mkv, with a folder.jpg in each show """
+    shows = max(files // (SEASONS_PER_SHOW * EPISODES_PER_SEASON), 1)
+    made = 0
+    for show in range(shows):
+        show_folder = os.path.join(root, f"Show {show:04d}")
+        os.makedirs(show_folder)
+        open(os.path.join(show_folder, "folder.jpg"), "wb").close()
+        for season in range(1, SEASONS_PER_SHOW + 1):
+            season_folder = os.path.join(show_folder, f"Season {season:02d}")
+            os.makedirs(season_folder)
+            for episode in range(1, EPISODES_PER_SEASON + 1):
+                open(os.path.join(season_folder, f"Show {show:04d} - S{season:02d}E{episode:02d}.mkv"), "wb").close()
+                made += 1
+    return made
+
+
+def legacy_folder_files(root):
+    """ As the queue builders did - listdir each season folder, then isfile & stat each file for its size & mtime """
+    found = 0
+    for show in sorted(os.listdir(root)):
+        show_folder = os.path.join(root, show)
+        if not os.path.isdir(show_folder):
+            continue
+        for season in sorted(os.listdir(show_folder)):
+            season_folder = os.path.join(show_folder, season)
+            if not os.path.isdir(season_folder):
+                continue
+            for file_name in os.listdir(season_folder):
+                path = os.path.join(season_folder, file_name)
+                if os.path.isfile(path):
+                    found += os.stat(path).st_size >= 0
+    return found
+
+
+def scan_folder_files(root):
+    """ The same, with a scan (one stat per entry) of each folder """
+    found = 0
+    for show in scan(root, with_stat=False):
+        if not show.is_dir:
+            continue
+        for season in scan(show.path, with_stat=False):
+            if not season.is_dir:
+                continue
+            for entry in scan(season.path):
+                found += not entry.is_dir and entry.size >= 0
+    return found
+
+
+def legacy_video_files(root):
+    """ As sxxexx_video_files_in_path did - one recursive glob per video extension """
+    found = 0
+    for extension in store.video_file_extensions:
+        found += len(glob.glob(f"{root}/**/*{extension}", recursive=True))
+    return found
+
+
+def scan_video_files(root):
+    """ One scan of the tree, filtered by extension """
+    extensions = set(store.video_file_extensions)
+    return sum(1 for entry in scan_tree(root, with_stat=False, hidden=False)
+               if not entry.is_dir and os.path.splitext(entry.name)[1] in extensions)
+
+
+def legacy_folder_size(root):
+    """ As folder_size_in_bytes did - os.walk, and getsize each file """
+    total = 0
+    for dir_path, dir_names, file_names in os.walk(root):
+        for file_name in file_names:
+            total += os.path.getsize(os.path.join(dir_path, file_name)) + 1
+    return total
+
+
+def scan_folder_size(root):
+    return sum(entry.size + 1 for entry in scan_tree(root) if not entry.is_dir)
+
+
+BENCHMARKS = [
+    ("folder files + stat", legacy_folder_files, scan_folder_files),
+    ("recursive video files", legacy_video_files, scan_video_files),
+    ("folder size", legacy_folder_size, scan_folder_size),
+]
+
+
+def best_of(function, root):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = function(root)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main(args):
+    files = int(args[args.index("--files") + 1]) if "--files" in args else DEFAULT_FILES
+    folders = [arg for arg in args if not arg.startswith("--") and not arg.isdigit()]
+    with tempfile.TemporaryDirectory() as scratch:
+        if folders:
+            root = folders[0]
+        else:
+            print(f"Creating a synthetic library of {files} files in {scratch}...")
+            files = make_synthetic_library(scratch, files)
+            root = scratch
+
+        print(f"Best of {ROUNDS} runs:")
+        for label, legacy, scanned in BENCHMARKS:
+            legacy_seconds, legacy_result = best_of(legacy, root)
+            scan_seconds, scan_result = best_of(scanned, root)
+            assert legacy_result == scan_result, f"{label}: results differ ({legacy_result} vs {scan_result})"
+            print(f"{label:>22}: legacy {legacy_seconds:.3f}s, scan {scan_seconds:.3f}s "
+                  f"({legacy_seconds / scan_seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -12,7 +12,7 @@ from .agogo import do_agogo
 from .clean import do_delete_watched, do_delete_lower_quality_duplicates
 from .init import do_init
 from .kodi import connect_to_kodi_or_die
-from .update import do_update
+from .update import do_update, do_fan_out_update
 from .bossanova808 import do_b808_stuff
 
 
@@ -66,11 +66,14 @@ def delete_dupes(name):
 @click.option('--limit-to', 'limit_to',
               help="Limit the library update to just tv or just movies",
               type=click.Choice(['movies', 'tv'], case_sensitive=False))
+@click.option('--verify/--no-verify', default=False,
+              help="Re-read each copied file from the destination drive and check it matches the source")
 # @cli, not @click!
-def agogo(limit_to):
+def agogo(limit_to, verify):
     console.log(f'[green]Kodi Agogo[/green] - copying all unwatched media')
     store.name = 'agogo'
     store.command = 'agogo'
+    store.copy_verify = verify
     store.set_media_limits(limit_to)
     config.load_media_library_paths()
     config.load_subscriber_paths()
@@ -87,11 +90,14 @@ def agogo(limit_to):
 @click.option('--limit-to', 'limit_to',
               help="Limit the library update to just tv or just movies",
               type=click.Choice(['movies', 'tv'], case_sensitive=False))
+@click.option('--verify/--no-verify', default=False,
+              help="Re-read each copied file from the destination drive and check it matches the source")
 # @cli, not @click!
-def agogo_kids(limit_to):
+def agogo_kids(limit_to, verify):
     console.log(f'[green]Kodi Agogo (KIDS!)[/green] - copying all unwatched media')
     store.name = 'agogo-kids'
     store.command = 'agogo-kids'
+    store.copy_verify = verify
     store.set_media_limits(limit_to)
     config.load_media_library_paths()
     config.load_subscriber_paths()
@@ -125,17 +131,35 @@ def init(name, first_run):
 @click.option('--limit-to', 'limit_to',
               help="Limit the library update to just tv or just movies",
               type=click.Choice(['movies', 'tv'], case_sensitive=False))
-def update(name, limit_to):
+@click.option('--verify/--no-verify', default=False,
+              help="Re-read each copied file from the destination drive and check it matches the source")
+def update(name, limit_to, verify):
     """The name of the person to run the update for, e.g. laura or kathrex"""
     console.log(f'[bold green]Update[/bold green] media library for: [yellow]{name}')
     store.name = name
     store.command = 'update'
+    store.copy_verify = verify
     config.load_media_library_paths()
     config.load_subscriber_paths()
     store.set_media_limits(limit_to)
     do_update()
 
 
+@cli.command(help="[90m[✗ Kodi][0m Update several subscribers' media libraries at once, reading each file from the source just once")
+@click.argument('names', nargs=-1, required=True)
+@click.option('--limit-to', 'limit_to',
+              help="Limit the library updates to just tv or just movies",
+              type=click.Choice(['movies', 'tv'], case_sensitive=False))
+@click.option('--verify/--no-verify', default=False,
+              help="Re-read each copied file from the destination drives and check it matches the source")
+def fan_out(names, limit_to, verify):
+    """The names of the people to run the update for, e.g. laura kathrex"""
+    console.log(f'[bold green]Fan-out Update[/bold green] media libraries for: [yellow]{", ".join(names)}')
+    store.command = 'fan_out'
+    store.copy_verify = verify
+    do_fan_out_update(list(names), limit_to)
+
+
 # @cli.command(hidden=True)
 # def helper():
 #     pass
@@ -1,6 +1,8 @@
 import os
 import yaml
 from base.console import console
+from base.durability import DurabilityPolicy
+from base.library_index import library_index
 from datetime import datetime
 from models.store import store
 
@@ -14,6 +16,7 @@ def load_media_library_paths():
     mediacopier_config = yaml.full_load(open(f"{store.mediacopier_path}/config/MediaCopier/config.library.paths.yaml"))
     store.tv_input_paths = mediacopier_config["tv_paths"]
     store.movie_input_paths = mediacopier_config["movie_paths"]
+    store.scan_threads_per_device = mediacopier_config.get("scan_threads_per_device", 2)
 
     if store.name == "agogo":
         store.tv_input_paths = [path for path in store.tv_input_paths if 'adults' in path]
@@ -30,6 +33,14 @@ def load_media_library_paths():
     store.session_archive_path = f'{store.mediacopier_path}/results/archive/{store.name}/{datetime.now().strftime("%Y-%m-%d")}'
 
 
+def load_library_index():
+    """
+    Load the index of the source libraries, so folders that haven't changed since the last run aren't listed again
+    {store.mediacopier_path}/results/library.index.json
+    """
+    library_index.load(f"{store.mediacopier_path}/results/library.index.json")
+
+
 def load_subscriber_paths():
     """
     Load in the subscriber config file containing the output paths &, if agogo, the Kodi details
@@ -42,6 +53,26 @@ def load_subscriber_paths():
     store.movie_output_path = loaded_config["paths"]["movie_output_path"]
     store.copy_speed_limit_mbps = loaded_config.get("copy_speed_limit_mbps", None)
     store.copy_speed_limit_threshold_gb = loaded_config.get("copy_speed_limit_threshold_gb", None)
+    store.copy_speed_limit_burst_mb = loaded_config.get("copy_speed_limit_burst_mb", None)
+    store.copy_speed_limit_adaptive = loaded_config.get("copy_speed_limit_adaptive", False)
+    store.copy_streams_per_source_device = loaded_config.get("copy_streams_per_source_device", 1)
+    store.copy_streams_per_destination_device = loaded_config.get("copy_streams_per_destination_device", 1)
+    store.copy_pipelined = loaded_config.get("copy_pipelined", False)
+    store.copy_resume = loaded_config.get("copy_resume", True)
+    store.copy_atomic = loaded_config.get("copy_atomic", True)
+    store.copy_preallocate = loaded_config.get("copy_preallocate", True)
+    store.copy_drop_page_cache = loaded_config.get("copy_drop_page_cache", True)
+    store.copy_direct_io_threshold_gb = loaded_config.get("copy_direct_io_threshold_gb", None)
+    store.copy_order_by_disk_location = loaded_config.get("copy_order_by_disk_location", True)
+    store.copy_small_file_threshold_mb = loaded_config.get("copy_small_file_threshold_mb", 8)
+    store.copy_small_file_workers = loaded_config.get("copy_small_file_workers", 8)
+    store.copy_clone = loaded_config.get("copy_clone", "reflink")
+    store.copy_checksum = loaded_config.get("copy_checksum", False)
+    store.copy_pack_to_fit = loaded_config.get("copy_pack_to_fit", False)
+    store.copy_durability = loaded_config.get("copy_durability", "library")
+    store.copy_durability_batch_gb = loaded_config.get("copy_durability_batch_gb", 10)
+    # Check the durability settings now (raises ValueError if they're bad), rather than once copying starts
+    DurabilityPolicy(store.copy_durability, store.copy_durability_batch_gb)
 
     # Extra config for agogo
     if "agogo" in store.name:
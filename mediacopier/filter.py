@@ -1,6 +1,8 @@
 import os
 
 from base.console import console, log
+from base.copy import destination_index, index_destinations
+from base.journal import load_journal, journal_confirms
 from models.store import store
 
 
@@ -99,15 +101,36 @@ def filter_copy_queue_by_already_copied_in_full(copy_queue: list):
 
     console.log(f"Length of unfiltered copy queue: {len(copy_queue)}")
 
+    # What a previous, interrupted, run copied - its copies are only trusted if their source hasn't changed since
+    # (and, with --verify, they were verified)
+    journal = load_journal()
+    confirmed_by_journal = 0
+    recopied = 0
+    # One walk of the output path(s), rather than a stat per file
+    index_destinations()
+
     with console.status('Filtering by: Already on Destination Drive'):
 
         for potential_copy in copy_queue:
-            if os.path.exists(potential_copy.destination_file):
-                # Use file_size from CopyItem rather than re-stating the source file
-                if potential_copy.file_size == os.path.getsize(potential_copy.destination_file):
+            # Use file_size from CopyItem rather than re-stating the source file
+            if potential_copy.file_size == destination_index.size_of(potential_copy.destination_file):
+                entry = journal.get(potential_copy.destination_file)
+                if entry is None:
                     # console.log(f"Skipping {potential_copy.file_name} as EXISTS and SAME SIZE")
                     continue
+                # (The journal only vouches for files still there at full size - it can't tell if one was deleted since)
+                if journal_confirms(entry, potential_copy, need_hash=store.copy_verify):
+                    confirmed_by_journal += 1
+                    continue
+                # Same size, but copied from a source that has changed since (or not verified) - copy it again, from scratch
+                potential_copy._recopy = True
+                recopied += 1
             filtered_copy_queue.append(potential_copy)
 
+        if confirmed_by_journal:
+            console.log(f"{confirmed_by_journal} file(s) already copied by an interrupted previous run (per the copy journal)")
+        if recopied:
+            console.log(f"{recopied} file(s) copied by an interrupted previous run will be copied again - their source has "
+                        f"changed since{' (or they were not verified)' if store.copy_verify else ''}", style="warning")
         console.log(f"Length of filtered copy queue: {len(filtered_copy_queue)}")
         return filtered_copy_queue
@@ -3,7 +3,8 @@ import yaml
 
 from base.console import console
 from models.store import store
-from base import utils
+from base.library_index import library_index
+from mediacopier import config
 
 
 def do_init(first_unwatched_episodes=None):
@@ -23,6 +24,8 @@ def do_init(first_unwatched_episodes=None):
 
     console.rule(f'[green]Init[/green] mediacopier for new name: [dodger_blue1]{store.name}')
 
+    config.load_library_index()
+
     # 1. TV SHOWS
     # Skip TV entirely when running mc init agogo --first-run — that command is only for regenerating the movies config
     if store.update_tv and not ("agogo" in store.name and store.agogo_first_run):
@@ -47,9 +50,7 @@ def do_init(first_unwatched_episodes=None):
                 tv_show_list = []
 
                 for tv_path in store.tv_input_paths:
-                    list_of_directories = utils.list_of_folder_contents_as_paths(tv_path)
-                    list_of_directories = filter(os.path.isdir, list_of_directories)
-                    list_of_directories = sorted(list_of_directories)
+                    list_of_directories = [entry.path for entry in library_index.listing(tv_path) if entry.is_dir]
                     for tv_show in map(os.path.basename, list_of_directories):
                         if tv_show != "lost+found":
                             tv_show_list.append(tv_show)
@@ -141,7 +142,7 @@ def do_init(first_unwatched_episodes=None):
                 watched_movies = []
 
                 for movie_path in store.movie_input_paths:
-                    list_of_directories = utils.list_of_folder_contents_as_paths(movie_path)
+                    list_of_directories = [entry.path for entry in library_index.listing(movie_path)]
                     for movie in map(os.path.basename, list_of_directories):
                         watched_movies.append(movie)
 
@@ -168,4 +169,5 @@ def do_init(first_unwatched_episodes=None):
 
             console.log(f"Created '{out_config_paths_filename}'")
 
+    library_index.save()
     console.log(f"Finished init for '{store.name}'.")
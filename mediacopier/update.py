@@ -8,11 +8,26 @@ from models.copy_item import CopyItem
 from models.store import store
 from mediacopier import config
 from mediacopier.filter import filter_tv_queue_by_kodi_watched_status, filter_copy_queue_by_already_copied_in_full
-from base import utils
-from base.copy import copy, check_disk_space
+from base.copy import copy, copy_fan_out, check_disk_space
+from base.journal import clear_journal
+from base.library_index import library_index
 
 # Pre-compiled regex for SxxExx matching — avoids recompiling for every file in every season
 _SXXEXX_RE = re.compile(r'S[0-9]+E[0-9]+', re.IGNORECASE)
+_SEASON_FOLDER_RE = re.compile(r'Season ([0-9]{2,})')
+
+
+def season_folders(show_folder):
+    """
+    Map season number -> season folder, for the 'Season NN' folders in a show folder (one listing of it)
+    """
+    seasons = {}
+    for entry in library_index.listing(show_folder):
+        match = _SEASON_FOLDER_RE.fullmatch(entry.name)
+        # Only folders named as we'd look for them, i.e. 'Season 01' but not 'Season 1'
+        if match and entry.is_dir and entry.name == f"Season {int(match.group(1)):02d}":
+            seasons[int(match.group(1))] = entry.path
+    return seasons
 
 
 def build_show_lists():
@@ -24,18 +39,19 @@ def build_show_lists():
     all_available_tv_shows_list = []
     new_tv_shows_list = []
 
+    library_index.scan(store.tv_input_paths, store.tv_input_paths, store.scan_threads_per_device)
     for d in store.tv_input_paths:
-        shows_in_this_path = os.listdir(d)
+        shows_in_this_path = library_index.listing(d)
         # console.log(d + " contains:\n" + str(shows_in_this_path))
         for show_in_this_path in shows_in_this_path:
-            if not show_in_this_path.startswith('.') and show_in_this_path not in ["lost+found"]:
-                show_path = os.path.join(d, show_in_this_path)
-                if os.path.isdir(show_path):
+            if not show_in_this_path.name.startswith('.') and show_in_this_path.name not in ["lost+found"]:
+                show_path = show_in_this_path.path
+                if show_in_this_path.is_dir:
                     all_available_tv_shows_list.append(show_path)
-                    if show_in_this_path not in store.tv_subscriptions_basic_show_list:
+                    if show_in_this_path.name not in store.tv_subscriptions_basic_show_list:
                         new_tv_shows_list.append(show_path)
                 else:
-                    console.log(show_in_this_path + " - is not a directory.", style="danger")
+                    console.log(show_in_this_path.name + " - is not a directory.", style="danger")
 
     with open(f'{store.mediacopier_path}/results/tv.library.all.txt', 'w', encoding='utf-8') as f:
         for show in all_available_tv_shows_list:
@@ -51,6 +67,25 @@ def build_show_lists():
     return all_available_tv_shows_list, new_tv_shows_list
 
 
+def scan_wanted_shows(available_shows: dict):
+    """
+    Scan the folders of all the subscribed shows (not those at 0|0), and their season folders, in parallel -
+    so the per-show processing in create_tv_copy_queue finds them already in the library index
+    """
+    wanted_show_paths = []
+    for subscription in store.tv_subscriptions:
+        values = subscription.strip().split('|')
+        try:
+            if int(values[1]) == 0 and int(values[2]) == 0:
+                continue
+        except (IndexError, ValueError):
+            pass
+        show_path = available_shows.get(store.map_show_name_to_folder.get(values[0], values[0]))
+        if show_path:
+            wanted_show_paths.append(show_path)
+    library_index.scan(wanted_show_paths, store.tv_input_paths, store.scan_threads_per_device, subfolders=True)
+
+
 def create_movie_copy_queue():
     """
     Create & return the list of movies to copy
@@ -61,13 +96,14 @@ def create_movie_copy_queue():
     movies_available = []
 
     if store.movie_input_paths:
+        library_index.scan(store.movie_input_paths, store.movie_input_paths, store.scan_threads_per_device)
         for folder in store.movie_input_paths:
             # If doing agogo or agogo_kids, skip any movie libraries that are not relevant
             if store.name == "agogo" and "kids" in folder:
                 continue
             elif store.name == "agogo-kids" and "adults" in folder:
                 continue
-            files_in_path = utils.list_of_folder_contents_as_paths(folder)
+            files_in_path = [entry.path for entry in library_index.listing(folder)]
             for movie_file in files_in_path:
                 if movie_file != ".deletedByTMM" and not (os.path.basename(movie_file).startswith(".") and os.path.basename(movie_file).endswith(".drive")):
                     movies_available.append(movie_file)
@@ -112,16 +148,17 @@ def create_movie_copy_queue():
                     new_movie_file.write(f"{movie_name} - Selected\n")
 
                     # Add all the files from the movie folder - we don't bother with sub-dirs like '.actors' or 'extrafanart'
-                    movie_files = [f for f in os.listdir(movie) if os.path.isfile(os.path.join(movie, f))]
+                    movie_files = library_index.files(movie)
 
                     for movie_file in movie_files:
                         movie_copy_queue.append(CopyItem(
-                            file_name=movie_file,
-                            file_size=os.path.getsize(os.path.join(movie, movie_file)),
+                            file_name=movie_file.name,
+                            file_size=movie_file.size,
+                            source_mtime=movie_file.mtime,
                             source_folder=movie,
                             destination_folder=str(os.path.join(store.movie_output_path, movie_name)),
-                            source_file=os.path.join(movie, movie_file),
-                            destination_file=str(os.path.join(store.movie_output_path, movie_name, movie_file)),
+                            source_file=movie_file.path,
+                            destination_file=str(os.path.join(store.movie_output_path, movie_name, movie_file.name)),
                         ))
 
     console.log(f"Wrote '{new_movies_file}'")
@@ -187,6 +224,14 @@ def create_tv_copy_queue():
                 log(f"New show [bold]{show_name}[/bold] -> [red]Subscribe[/red]", indent=0)
                 store.tv_subscriptions.append(show_name + "|1|0\n")
 
+    # Show name -> folder, for looking up each subscription (if a show is in more than one input path, the first)
+    available_shows = {}
+    for show_path in all_available_tv_shows_list:
+        available_shows.setdefault(os.path.basename(show_path), show_path)
+
+    # List the wanted shows, and their season folders, across all the library disks at once
+    scan_wanted_shows(available_shows)
+
     console.log("\nNow, process each wanted show.\n")
 
     # For each wanted show...
@@ -196,7 +241,6 @@ def create_tv_copy_queue():
         wanted_season_int = None
         wanted_episode = None
         original_wanted_episode = None
-        wanted_season = None
         found_show = False
         origin_folder = ""
         output_folder = ""
@@ -206,7 +250,6 @@ def create_tv_copy_queue():
             values = subscription.split('|')
             wanted_show = values[0]
             wanted_season_int = int(values[1])
-            wanted_season = format(wanted_season_int, "02d")
             wanted_episode = int(values[2])
             original_wanted_episode = wanted_episode
             show_id = int(values[3])
@@ -222,18 +265,15 @@ def create_tv_copy_queue():
 
         ############
         # First, do we recognise this show?  E.g. has it been removed from the library (or name change)
-        # Apply name mapping once before the search loop (not inside it, to avoid remapping on every iteration)
+        # Apply name mapping before looking the show up
         wanted_show_unmapped = wanted_show
         wanted_show = store.map_show_name_to_folder.get(wanted_show, wanted_show)
         remap_msg = f"Remapped: {wanted_show_unmapped} -> {wanted_show}" if wanted_show_unmapped != wanted_show else None
 
-        for possible_show in all_available_tv_shows_list:
-            if wanted_show == os.path.basename(possible_show):
-                origin_folder = possible_show
-                output_folder = os.path.join(store.tv_output_path, wanted_show)
-                found_show = True
-                # show has been found so no need to compare further
-                break
+        if wanted_show in available_shows:
+            origin_folder = available_shows[wanted_show]
+            output_folder = os.path.join(store.tv_output_path, wanted_show)
+            found_show = True
         #######################
         # skip if set to 0,0 — log Handling inline and move on
         if wanted_season_int == 0 and wanted_episode == 0:
@@ -263,124 +303,88 @@ def create_tv_copy_queue():
         log(f'[bold green]Wanted:[/bold green] "{wanted_show}", from S{wanted_season_int:02d}E{wanted_episode:02d}', indent=1, style="success")
 
         # OK, so the show is available, and we want some of it.  Let's find out if there are new episodes?
-        start_season_int = int(wanted_season)
-        start_season_folder = os.path.join(origin_folder, "Season " + wanted_season)
-        start_season_folder_output = os.path.join(str(output_folder), "Season " + wanted_season)
-
-        # set up for loop
-        current_season_folder = start_season_folder
-        current_season_folder_output = start_season_folder_output
-        current_season_int = start_season_int
-        episode_considering = 0
+        # Every season from the wanted one on, from one listing of the show folder - however big the gaps between
+        # them (e.g. Location, Location, Location has seasons 31,33,34,35...)
+        seasons = {season_int: season_folder for season_int, season_folder in season_folders(origin_folder).items()
+                   if season_int >= wanted_season_int}
 
-        season_folder_exists = True
-        # Used to track when we miss two seasons in a row...
-        missed_one_already = False
+        # set up for loop - if there are no seasons to look at, we're still at the wanted season
+        current_season_int = wanted_season_int
+        episode_considering = 0
         found_new_episode = False
 
-        # we loop through each season until we can't find two seasons in a row
         possible_output = []
-        while season_folder_exists:
-            if os.path.exists(current_season_folder):
-                # If we found a season, reset this
-                missed_one_already = False
-                # the season folder exists
-                # console.log(f"{indent}Handling {os.path.basename(current_season_folder)}", style="info")
-                # make a list of files in the current season
-                current_season_files = utils.list_of_folder_contents_as_paths(current_season_folder)
-                # Now we want to match only the wanted episode and above and add them to the copy queue
-                # keep track of them for logging
-                episodes_added = []
-                # and a queue to store files like folder.jpg that we will only copy if we found at least 1 new episode
-                possible_queue = []
-
-                for current_season_file in current_season_files:
-                    # match the SXXEXX part of the filename
-                    match = _SXXEXX_RE.search(current_season_file)
-                    if match:
-                        episode_string = match.group()
-                        episode_string = episode_string.split('E')[1]
-                        # console.log( f"episode_string is {episode_string}" )
-                        episode_considering = int(episode_string)
-                        # console.log( f"episode_considering is {episode_considering}" )
-                        if episode_considering > wanted_episode:
-                            found_new_episode = True
-                            if episode_string not in episodes_added:
-                                episodes_added.append(episode_string)
-                            tv_copy_queue.append(CopyItem(
-                                file_name=os.path.basename(current_season_file),
-                                file_size=os.path.getsize(current_season_file),
-                                source_folder=current_season_folder,
-                                destination_folder=current_season_folder_output,
-                                source_file=current_season_file,
-                                destination_file=os.path.join(current_season_folder_output, os.path.basename(current_season_file)),
-                                wanted_show=wanted_show,
-                                show_id=show_id,
-                                season=int(current_season_int),
-                                episode=int(episode_considering)
-                            ))
-
-                    else:
-                        # this queue not used anymore, see just below
-                        # console.log(f"{indent}Did not match - add to possible queue: {current_season_file}")
-                        possible_queue.append(CopyItem(
-                            file_name=os.path.basename(current_season_file),
-                            file_size=os.path.getsize(current_season_file),
+        for current_season_int, current_season_folder in sorted(seasons.items()):
+            current_season_folder_output = os.path.join(str(output_folder), os.path.basename(current_season_folder))
+            # console.log(f"{indent}Handling {os.path.basename(current_season_folder)}", style="info")
+            # make a list of files in the current season
+            current_season_files = library_index.listing(current_season_folder)
+            # Now we want to match only the wanted episode and above and add them to the copy queue
+            # keep track of them for logging
+            episodes_added = []
+            # and a queue to store files like folder.jpg that we will only copy if we found at least 1 new episode
+            possible_queue = []
+
+            for current_season_entry in current_season_files:
+                current_season_file = current_season_entry.path
+                # match the SXXEXX part of the filename
+                match = _SXXEXX_RE.search(current_season_file)
+                if match:
+                    episode_string = match.group()
+                    episode_string = episode_string.split('E')[1]
+                    # console.log( f"episode_string is {episode_string}" )
+                    episode_considering = int(episode_string)
+                    # console.log( f"episode_considering is {episode_considering}" )
+                    if episode_considering > wanted_episode:
+                        found_new_episode = True
+                        if episode_string not in episodes_added:
+                            episodes_added.append(episode_string)
+                        tv_copy_queue.append(CopyItem(
+                            file_name=current_season_entry.name,
+                            file_size=current_season_entry.size,
+                            source_mtime=current_season_entry.mtime,
                             source_folder=current_season_folder,
                             destination_folder=current_season_folder_output,
                             source_file=current_season_file,
                             destination_file=os.path.join(current_season_folder_output, os.path.basename(current_season_file)),
+                            wanted_show=wanted_show,
+                            show_id=show_id,
+                            season=int(current_season_int),
+                            episode=int(episode_considering)
                         ))
 
-                # Removed this Feb 24 as all it seems to copy is folder.jpgs in season folders
-                # e.g. Survivor Season 17/folder.jpg - when no other files will be copied as all get filtered...
-                # copy unmatched files if we're adding new things to this season (e.g. folder.jpg)
-                # if found_new_episode_this_season and len(possible_queue) > 0:
-                #     # console.log(f"{indent}Adding possible queue to tv copy queue, as we found a new episode")
-                #     # console.log(possible_queue)
-                #     tv_copy_queue.extend(possible_queue)
-
-                # if we're moving up a season we want all episodes from the new season
-                if len(episodes_added) > 0:
-                    possible_output.append(f"Added S{current_season_int:02d} - {episodes_added}")
                 else:
-                    possible_output.append(f"No episodes to add from S{current_season_int:02d}")
-
-                # get set up for the next season
-                wanted_episode = 0
-                current_season_int += 1
-                current_season_folder = os.path.join(origin_folder, f"Season {current_season_int:02d}")
-                current_season_folder_output = os.path.join(str(output_folder), f"Season {current_season_int:02d}")
+                    # this queue not used anymore, see just below
+                    # console.log(f"{indent}Did not match - add to possible queue: {current_season_file}")
+                    possible_queue.append(CopyItem(
+                        file_name=current_season_entry.name,
+                        file_size=current_season_entry.size,
+                        source_mtime=current_season_entry.mtime,
+                        source_folder=current_season_folder,
+                        destination_folder=current_season_folder_output,
+                        source_file=current_season_file,
+                        destination_file=os.path.join(current_season_folder_output, os.path.basename(current_season_file)),
+                    ))
 
+            # Removed this Feb 24 as all it seems to copy is folder.jpgs in season folders
+            # e.g. Survivor Season 17/folder.jpg - when no other files will be copied as all get filtered...
+            # copy unmatched files if we're adding new things to this season (e.g. folder.jpg)
+            # if found_new_episode_this_season and len(possible_queue) > 0:
+            #     # console.log(f"{indent}Adding possible queue to tv copy queue, as we found a new episode")
+            #     # console.log(possible_queue)
+            #     tv_copy_queue.extend(possible_queue)
+
+            # if we're moving up a season we want all episodes from the new season
+            if len(episodes_added) > 0:
+                possible_output.append(f"Added S{current_season_int:02d} - {episodes_added}")
             else:
-                possible_output.append(f"There is no '{current_season_folder}'")
-                # Because of some stupid shows/people, Location, Location, Location has seasons 31,33,34,35...so we skip
-                # over one folder and check again just to be sure we should be stopping...
-                if not missed_one_already:
-                    # console.log(
-                    #     f"Setting missed_one_already and incrementing current season from {current_season_int} to {current_season_int + 1}")
-                    missed_one_already = True
-                    current_season_int += 1
-                    current_season_folder = os.path.join(origin_folder, f"Season {current_season_int:02d}")
-                    current_season_folder_output = os.path.join(str(output_folder), f"Season {current_season_int:02d}")
-                    wanted_episode = 0
-                    continue
-                # If we missed_one_already, then we've added one to the current_season_int so take that back off again so that
-                # when we write the tracker file we're not one season forward...
-                else:
-                    current_season_int -= 1
-                    # console.log(f"Two season folders in a row don't exist, stop looking for more & reset current_season_int to {current_season_int}")
-                    break
-
-        # if we copied anything from this season, record the last thing we copied
-        # console.log(
-        #    f"At this point, current_season_int ({current_season_int}) should be 1 more than what we want to record, so set output_show_int to {current_season_int - 1}")
-        output_show_int = current_season_int - 1
-        # don't decrement if we didn't copy a new season
-        if output_show_int < wanted_season_int:
-            # console.log(f"But we didn't copy a new season, so in fact set output_show_int to wanted_season_int ({wanted_season_int})")
-            output_show_int = wanted_season_int
-        output_show_list[wanted_show] = [output_show_int, episode_considering]
+                possible_output.append(f"No episodes to add from S{current_season_int:02d}")
+
+            # get set up for the next season
+            wanted_episode = 0
+
+        # record the last thing we copied (in the last season we looked at)
+        output_show_list[wanted_show] = [current_season_int, episode_considering]
 
         # Nothing new?  We're done
         if not found_new_episode:
@@ -395,19 +399,20 @@ def create_tv_copy_queue():
 
         # But, if there are any new episodes, add the base files to the queue as well (e.g. folder.jpg)
         if found_new_episode:
-            base_dir_files = utils.list_of_files(origin_folder)
+            base_dir_files = library_index.files(origin_folder)
             base_files = []
             for base_dir_file in base_dir_files:
                 # tv_copy_queue.append([base_dir_file, output_folder])
                 tv_copy_queue.append(CopyItem(
-                    file_name=os.path.basename(base_dir_file),
-                    file_size=os.path.getsize(base_dir_file),
+                    file_name=base_dir_file.name,
+                    file_size=base_dir_file.size,
+                    source_mtime=base_dir_file.mtime,
                     source_folder=origin_folder,
                     destination_folder=str(output_folder),
-                    source_file=base_dir_file,
-                    destination_file=str(os.path.join(str(output_folder), os.path.basename(base_dir_file)))
+                    source_file=base_dir_file.path,
+                    destination_file=str(os.path.join(str(output_folder), base_dir_file.name))
                 ))
-                base_files.append(os.path.basename(base_dir_file))
+                base_files.append(base_dir_file.name)
             log(f"Base files (artwork etc) added to copy queue :white_check_mark:", indent=2, style="info")
 
             for line in possible_output:
@@ -418,9 +423,10 @@ def create_tv_copy_queue():
             # And if there are new episodes, always also attempt to copy the Specials (Season 00) folder, if there is one
             specials_path = os.path.join(origin_folder, "Season 00")
             output_specials_path = os.path.join(str(output_folder), "Season 00")
-            if os.path.exists(specials_path):
-                season00_files = utils.list_of_files(specials_path)
-                for season00_file in season00_files:
+            if library_index.is_dir(specials_path):
+                season00_files = library_index.files(specials_path)
+                for season00_entry in season00_files:
+                    season00_file = season00_entry.path
                     match = _SXXEXX_RE.search(season00_file)
                     if match:
                         se_string = match.group()
@@ -428,8 +434,9 @@ def create_tv_copy_queue():
                         episode_string = se_string[4:6]
                         log(f"Special (Season 00) file found and added to queue: '{os.path.basename(season00_file)}'", indent=2, style="info")
                         tv_copy_queue.append(CopyItem(
-                            file_name=os.path.basename(season00_file),
-                            file_size=os.path.getsize(season00_file),
+                            file_name=season00_entry.name,
+                            file_size=season00_entry.size,
+                            source_mtime=season00_entry.mtime,
                             source_folder=specials_path,
                             destination_folder=output_specials_path,
                             source_file=season00_file,
@@ -442,8 +449,9 @@ def create_tv_copy_queue():
                     else:
                         log(f"Could not match season/episode of special so adding to queue anyway to be safe: '{os.path.basename(season00_file)}'", indent=2, style="warning")
                         tv_copy_queue.append(CopyItem(
-                            file_name=os.path.basename(season00_file),
-                            file_size=os.path.getsize(season00_file),
+                            file_name=season00_entry.name,
+                            file_size=season00_entry.size,
+                            source_mtime=season00_entry.mtime,
                             source_folder=specials_path,
                             destination_folder=output_specials_path,
                             source_file=season00_file,
@@ -455,17 +463,18 @@ def create_tv_copy_queue():
             # Also copy the Trailers folder if present
             trailers_path = os.path.join(origin_folder, "Trailers")
             output_trailers_path = os.path.join(str(output_folder), "Trailers")
-            if os.path.exists(trailers_path):
-                trailer_files = utils.list_of_files(trailers_path)
+            if library_index.is_dir(trailers_path):
+                trailer_files = library_index.files(trailers_path)
                 for trailer_file in trailer_files:
-                    log(f"Trailer file added to queue: '{os.path.basename(trailer_file)}'", indent=2, style="info")
+                    log(f"Trailer file added to queue: '{trailer_file.name}'", indent=2, style="info")
                     tv_copy_queue.append(CopyItem(
-                        file_name=os.path.basename(trailer_file),
-                        file_size=os.path.getsize(trailer_file),
+                        file_name=trailer_file.name,
+                        file_size=trailer_file.size,
+                        source_mtime=trailer_file.mtime,
                         source_folder=trailers_path,
                         destination_folder=output_trailers_path,
-                        source_file=trailer_file,
-                        destination_file=os.path.join(output_trailers_path, os.path.basename(trailer_file)),
+                        source_file=trailer_file.path,
+                        destination_file=os.path.join(output_trailers_path, trailer_file.name),
                     ))
 
     store.original_show_list = original_show_list
@@ -533,10 +542,49 @@ def do_update():
     - Finally, do the actual copying (if not in pretend mode!)
     """
 
+    tv_copy_queue, movie_copy_queue = plan_update()
+    copy(tv_copy_queue, movie_copy_queue)
+    complete_update()
+
+
+def do_fan_out_update(names: list[str], limit_to=None):
+    """
+    Update several subscribers' drives at once, reading each source file just once (see copy_fan_out):
+    - Plan each subscriber's update in turn (the usual interactive questions, copy queues & space checks)
+    - Copy everything, each file going to every subscriber drive that needs it
+    - Then finish each subscriber's update as usual (save their configs, close the session...)
+    Each subscriber's settings (from their paths YAML) are kept in a snapshot of the store while the others are planned.
+    """
+    base_store = store.snapshot()
+    plans = []
+    for name in names:
+        store.restore(base_store)
+        store.name = name
+        config.load_media_library_paths()
+        config.load_subscriber_paths()
+        store.set_media_limits(limit_to)
+        tv_copy_queue, movie_copy_queue = plan_update()
+        plans.append((store.snapshot(), tv_copy_queue, movie_copy_queue))
+
+    copy_fan_out(plans)
+
+    for snapshot, _, _ in plans:
+        store.restore(snapshot)
+        complete_update()
+
+
+def plan_update():
+    """
+    Work out this subscriber's update - everything up to the actual copying.
+    Returns the tv and movie copy queues
+    """
+
     console.rule(f'Media Library [green]Update[/green] for [blue]{store.name}')
 
     # We load this in here, rather than in e.g. cli.py->update, as if we're doing an agogo, it's only just been created...
     config.load_tv_and_movie_config()
+    # ...and only list the library folders that have changed since last time
+    config.load_library_index()
 
     # Load any pending answers cache from a previous incomplete run
     _load_pending_answers_cache()
@@ -549,37 +597,47 @@ def do_update():
         console.rule(f'Processing TV Shows')
         tv_copy_queue = create_tv_copy_queue()
         if tv_copy_queue:
+            # (The index's file sizes can be stale for files rewritten in place - so check the ones we're copying)
+            tv_copy_queue = library_index.restat(tv_copy_queue)
             tv_copy_queue = filter_copy_queue_by_already_copied_in_full(tv_copy_queue)
         # if agogo, we double-check with Kodi and filter out things that have been watched out of sequence
         if "agogo" in store.name:
             tv_copy_queue = filter_tv_queue_by_kodi_watched_status(tv_copy_queue)
-        if tv_copy_queue:
-            with open(f"{store.mediacopier_path}/results/tv.copy.queue.txt", "w", encoding='utf-8') as f:
-                for tv_copy in tv_copy_queue:
-                    f.write(f"{tv_copy}\n")
-            console.log(f"Wrote '{store.mediacopier_path}/results/tv.copy.queue.txt'")
-
-            check_disk_space(tv_copy_queue, None)
-            console.rule("TV Space")
-            console.log(f"TV - available space is: {store.tv_available_space_gb:.2f} GB")
-            console.log(f"TV - needed space is:    {store.tv_needed_space_gb:.2f} GB")
 
     if store.update_movies:
         console.rule(f'Processing Movies')
         movie_copy_queue = create_movie_copy_queue()
         store.movies_were_selected = len(movie_copy_queue) > 0
         if movie_copy_queue:
+            movie_copy_queue = library_index.restat(movie_copy_queue)
             movie_copy_queue = filter_copy_queue_by_already_copied_in_full(movie_copy_queue)
-        if movie_copy_queue:
-            with open(f"{store.mediacopier_path}/results/movies.copy.queue.txt", "w", encoding='utf-8') as f:
-                for movie_copy in movie_copy_queue:
-                    f.write(f"{movie_copy}\n")
-            console.log("Wrote 'results/movies.copy.queue.txt'")
 
-            check_disk_space(None, movie_copy_queue)
-            console.rule("Movie Space")
-            console.log(f"Movies - available space is: {store.movies_available_space_gb:.2f} GB")
-            console.log(f"Movies - needed space is:    {store.movies_needed_space_gb:.2f} GB")
+    library_index.save()
+
+    # Check it all fits (once both queues are known, as TV & movies may share a drive) - if not, this cuts the
+    # queues down to what does
+    if tv_copy_queue or movie_copy_queue:
+        tv_copy_queue, movie_copy_queue = check_disk_space(tv_copy_queue, movie_copy_queue)
+
+    if tv_copy_queue:
+        with open(f"{store.mediacopier_path}/results/tv.copy.queue.txt", "w", encoding='utf-8') as f:
+            for tv_copy in tv_copy_queue:
+                f.write(f"{tv_copy}\n")
+        console.log(f"Wrote '{store.mediacopier_path}/results/tv.copy.queue.txt'")
+
+        console.rule("TV Space")
+        console.log(f"TV - available space is: {store.tv_available_space_gb:.2f} GB")
+        console.log(f"TV - needed space is:    {store.tv_needed_space_gb:.2f} GB")
+
+    if movie_copy_queue:
+        with open(f"{store.mediacopier_path}/results/movies.copy.queue.txt", "w", encoding='utf-8') as f:
+            for movie_copy in movie_copy_queue:
+                f.write(f"{movie_copy}\n")
+        console.log("Wrote 'results/movies.copy.queue.txt'")
+
+        console.rule("Movie Space")
+        console.log(f"Movies - available space is: {store.movies_available_space_gb:.2f} GB")
+        console.log(f"Movies - needed space is:    {store.movies_needed_space_gb:.2f} GB")
 
     # ...now actually copy the calculated queues
     console.rule("Total Space")
@@ -587,7 +645,9 @@ def do_update():
 
     # Apply speed limit now that we know the full transfer size across both TV and movies
     store.active_speed_limit_mbps = None
-    if store.copy_speed_limit_mbps and store.copy_speed_limit_threshold_gb:
+    if store.copy_speed_limit_adaptive:
+        console.log("Adaptive speed limiting is on - copying at full speed until the drive's SLC cache runs out.", style="info")
+    elif store.copy_speed_limit_mbps and store.copy_speed_limit_threshold_gb:
         if store.total_needed_space_gb >= store.copy_speed_limit_threshold_gb:
             store.active_speed_limit_mbps = store.copy_speed_limit_mbps
             console.log(
@@ -603,9 +663,15 @@ def do_update():
                 style="info"
             )
 
-    copy(tv_copy_queue, movie_copy_queue)
+    return tv_copy_queue, movie_copy_queue
+
+
+def complete_update():
+    """
+    Once the copying is done - save the subscriber's updated config, and tidy up
+    """
 
-    # ...and write out the updated subscription tracker files
+    # ...write out the updated subscription tracker files
     if store.update_tv and "agogo" not in store.name:
         config.save_tv_config()
     if store.update_movies:
@@ -614,8 +680,9 @@ def do_update():
     # ...and, finally, we're done!
     console.rule(f'Finished Media Library [green]Update[/green] for [dodger_blue1]{store.name}!')
 
-    # Clear the pending answers cache now that we completed successfully
+    # Clear the pending answers cache and the copy journal now that we completed successfully
     _clear_pending_answers_cache()
+    clear_journal()
 
     # Prompt to archive the old config, and swap in the new for future updates
     finish_update()
@@ -5,6 +5,8 @@ from dataclasses import dataclass
 class CopyItem:
     file_name: str = None
     file_size: int = None
+    # The source file's modification time when the queue was built (for the copy journal)
+    source_mtime: float = None
     source_folder: str = None
     destination_folder: str = None
     source_file: str = None
@@ -1,3 +1,4 @@
+import copy
 from dataclasses import dataclass
 from kodipydent import Kodi
 from base.console import console
@@ -30,6 +31,9 @@ class _Store:
     # The lists of paths that contain TV shows or movies
     tv_input_paths: list = None
     movie_input_paths: list = None
+    # How many folders to list at once on any one library disk, when scanning the library (the input paths on different
+    # disks are scanned at the same time) - scan_threads_per_device in config.library.paths.yaml
+    scan_threads_per_device: int = 2
     # The output paths for this subscriber
     tv_output_path = None
     movie_output_path = None
@@ -67,6 +71,52 @@ class _Store:
     copy_speed_limit_mbps: int = None
     copy_speed_limit_threshold_gb: int = None
     active_speed_limit_mbps: int = None
+    # How far (in MB) the copy may run ahead of the speed limit in a burst - copy_speed_limit_burst_mb in the
+    # paths YAML.  Defaults to one second's worth at the limit.
+    copy_speed_limit_burst_mb: int = None
+    # Instead of the static threshold, watch the drive's write throughput and only limit speed (to
+    # copy_speed_limit_mbps, if set) once it falls off its SLC cache cliff - copy_speed_limit_adaptive in the paths YAML
+    copy_speed_limit_adaptive: bool = False
+    # How many files may be copied at once from any one source drive, and to any one destination drive
+    # (drives are identified by st_dev). Set in the subscriber's paths YAML; both default to 1 (one file at a time).
+    copy_streams_per_source_device: int = 1
+    copy_streams_per_destination_device: int = 1
+    # Carry on from where an interrupted copy got to, if the partial file checks out - copy_resume in the paths YAML
+    copy_resume: bool = True
+    # Copy to a temporary '.name.partial' file and rename it into place when complete - copy_atomic in the paths YAML
+    copy_atomic: bool = True
+    # When to fsync copied files: none, file, batch (every copy_durability_batch_gb) or library - copy_durability
+    copy_durability: str = "library"
+    copy_durability_batch_gb: int = 10
+    # Reserve each file's disk space before copying it (where the filesystem supports it) - copy_preallocate
+    copy_preallocate: bool = True
+    # Keep copies from flushing the server's page cache (posix_fadvise hints) - copy_drop_page_cache in the paths YAML
+    copy_drop_page_cache: bool = True
+    # Copy files of at least this size with direct I/O (O_DIRECT), bypassing the page cache entirely, for steady
+    # throughput to USB drives - copy_direct_io_threshold_gb in the paths YAML (default: never)
+    copy_direct_io_threshold_gb: float = None
+    # Overlap reading and writing each file (read-ahead thread + ring of buffers) - copy_pipelined in the paths YAML
+    copy_pipelined: bool = False
+    # Copy each source drive's files in the order they sit on the disk (fewer seeks on spinning disks), rather than
+    # show/season order - copy_order_by_disk_location in the paths YAML
+    copy_order_by_disk_location: bool = True
+    # Files smaller than this (artwork, .nfo, subtitles...) are copied in batches by a pool of
+    # copy_small_file_workers threads (within the copy_streams_per_* limits for each drive), without a progress bar
+    # each - copy_small_file_threshold_mb in the paths YAML
+    copy_small_file_threshold_mb: float = 8
+    copy_small_file_workers: int = 8
+    # Where a destination is on the same filesystem as the source (e.g. a staging folder on the server), don't copy the
+    # data: "reflink" (btrfs, XFS...) or "hardlink" - or "none" to always copy.  copy_clone in the paths YAML
+    copy_clone: str = "reflink"
+    # Hash each file (BLAKE2b) as it is copied - copy_checksum in the paths YAML
+    copy_checksum: bool = False
+    # Re-read each copied file from the destination drive and check it against the source's hash (implies
+    # copy_checksum) - the --verify option.  Mismatched files are retried once at the end.
+    copy_verify: bool = False
+    # If the queues won't fit on the destination drive(s), copy the most valuable subset that does (artwork, then each
+    # show's next episodes, newer seasons, then movies) and defer the rest, rather than exiting - copy_pack_to_fit
+    # in the paths YAML (off by default, as it winds back the tracker for the shows it defers)
+    copy_pack_to_fit: bool = False
     # Set to True during an update run if any movies were selected for copying
     movies_were_selected: bool = False
     # Reduce calls to Kodi for speed's sake
@@ -127,6 +177,19 @@ class _Store:
             case _:
                 console.log("[green]Both TV & Movies will be updated[/green]")
 
+    def snapshot(self):
+        """
+        A copy of the store as it is now (e.g. one subscriber's settings, when updating several at once)
+        """
+        return copy.copy(self)
+
+    def restore(self, snapshot):
+        """
+        Put the store back to a snapshot - in place, as everything shares this one instance
+        """
+        self.__dict__.clear()
+        self.__dict__.update(snapshot.__dict__)
+
     # noinspection PyUnusedLocal
     def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
         """
@@ -148,13 +211,27 @@ class _Store:
         my_table.add_row("TV Output Path", str(self.tv_output_path))
         my_table.add_row("Movie Output Path", str(self.movie_output_path))
         my_table.add_row("Session Archive Path", str(self.session_archive_path))
-        if self.copy_speed_limit_mbps and self.copy_speed_limit_threshold_gb:
+        if self.copy_speed_limit_adaptive:
+            my_table.add_section()
+            my_table.add_row("[red]Copy Speed Limit[/red]",
+                             f"[yellow]Adaptive[/yellow] (backs off to [yellow]{f'{self.copy_speed_limit_mbps} MB/s' if self.copy_speed_limit_mbps else 'measured sustainable speed'}[/yellow] when the SLC cache runs out)")
+        elif self.copy_speed_limit_mbps and self.copy_speed_limit_threshold_gb:
             my_table.add_section()
             my_table.add_row("[red]Copy Speed Limit[/red]",
                              f"[yellow]{self.copy_speed_limit_mbps} MB/s[/yellow] (applies when transfer exceeds [yellow]{self.copy_speed_limit_threshold_gb} GB[/yellow])")
         elif self.copy_speed_limit_mbps or self.copy_speed_limit_threshold_gb:
             my_table.add_section()
             my_table.add_row("[red]Copy Speed Limit[/red]", "[red]Misconfigured — both copy_speed_limit_mbps and copy_speed_limit_threshold_gb must be set[/red]")
+        my_table.add_section()
+        my_table.add_row("Copy Durability",
+                         f"{'Atomic (.partial, then renamed)' if self.copy_atomic else 'Direct to final name'}, fsync policy "
+                         f"'{self.copy_durability}'{f' (every {self.copy_durability_batch_gb} GB)' if self.copy_durability == 'batch' else ''}")
+        if self.copy_verify or self.copy_checksum:
+            my_table.add_row("Copy Checksums", "BLAKE2b, [green]verified against the destination drive[/green]" if self.copy_verify else "BLAKE2b (not verified)")
+        if self.copy_streams_per_source_device > 1 or self.copy_streams_per_destination_device > 1:
+            my_table.add_section()
+            my_table.add_row("Parallel Copies",
+                             f"{self.copy_streams_per_source_device} per source drive, {self.copy_streams_per_destination_device} per destination drive")
         if 'agogo' in store.name:
             my_table.add_section()
             my_table.add_row("Kodi IP", self.kodi_ip)
@@ -1,14 +1,34 @@
-from rich.console import Group
+import threading
+from collections import Counter
+
+from rich.console import Console, ConsoleOptions, Group, RenderResult
 from rich.panel import Panel
-from rich.text import Text
 from rich.progress import Progress, TaskID, TextColumn, BarColumn, TaskProgressColumn, TimeRemainingColumn, \
     TimeElapsedColumn, TransferSpeedColumn
 from rich.layout import Layout
 
 
+class _ByteCounter:
+    """
+    Bytes copied for one file (to one destination) - only ever added to by the thread doing that copy,
+    and read by CopyProgress.flush()
+    """
+    __slots__ = ("file_task", "group_task", "value", "flushed")
+
+    def __init__(self, file_task, group_task):
+        self.file_task = file_task
+        self.group_task = group_task
+        self.value = 0
+        self.flushed = 0
+
+
 class CopyProgress:
     """
     Class to encapsulate the progress displays we use once we finally get to the copying stage.
+
+    The copy callbacks (file_callback etc.) just add to a plain integer counter per file, so the copy loops
+    don't pay for rich's locking on every chunk.  The counters are pushed to the progress bars by flush(), which
+    happens whenever the display is refreshed - so pass the CopyProgress itself (not its layout) to Live.
     """
 
     group: Group
@@ -27,9 +47,14 @@ class CopyProgress:
 
     panel_width: int = 160
     bar_width: int = panel_width - 40
+    file_name_width: int = 60
 
     def __init__(self):
 
+        self._counters = []
+        self._counters_lock = threading.Lock()
+        self._legacy_callback = None
+
         self.overall = Progress(
             TextColumn("[progress.description]{task.description}"),
             BarColumn(pulse_style='', bar_width=self.bar_width),
@@ -52,7 +77,7 @@ class CopyProgress:
 
         self.current_file = Progress(
             TextColumn("[progress.description]{task.description}"),
-            BarColumn(pulse_style='', bar_width=self.bar_width),
+            BarColumn(pulse_style='', bar_width=self.bar_width - self.file_name_width),
             TransferSpeedColumn(),
             "•",
             TaskProgressColumn(),
@@ -68,17 +93,13 @@ class CopyProgress:
         )
         self.progress_panel = Panel(progress_group, title="Progress", width=self.panel_width)
 
-        self.current_filename = Text("File: ")
-        panel_group = Group(
-            self.current_filename,
-            self.current_file
-        )
-        self.current_file_panel = Panel(panel_group, title="Current File", width=self.panel_width)
+        # Built once - each file being copied is a task (i.e. a line) in self.current_file
+        self.current_file_panel = Panel(self.current_file, title="Current File(s)", width=self.panel_width)
 
         self.layout = Layout()
         self.layout.split_column(
             Layout(self.progress_panel, name="upper", size=4),
-            Layout(self.current_file_panel, name="lower", size=4)
+            Layout(self.current_file_panel, name="lower", size=3)
         )
 
     def prep_overall_progress(self, size_overall: int):
@@ -88,14 +109,97 @@ class CopyProgress:
         self.current_library_task = self.overall.add_task(library_type.ljust(10), total=size_library)
 
     def prep_current_file_progress(self, name_current_file, size_current_file: int):
-        self.current_file_task = self.current_file.add_task("Copying".ljust(10), total=size_current_file)
-        group = Group(
-            # Limit the filename length here so it doesn't get chopped off...
-            f"{name_current_file[:self.panel_width-10]} ({size_current_file/1024/1024/1024:.2f} GB)",
-            self.current_file
-        )
-        panel = Panel(group, title="Current File", width=self.panel_width)
-        self.layout["lower"].update(panel)
+        self.current_file_task = self.add_file(name_current_file, size_current_file)
+
+    def add_file(self, name_file, size_file: int, completed: int = 0, copies: int = 1) -> TaskID:
+        """
+        Add a progress bar for a file that is now being copied (there may be several at once).
+        completed is how much of it is already there (i.e. when resuming a partial copy).
+        copies is how many destinations it is being copied to at once (fan-out).
+        Returns the task to pass to file_callback/complete_file.
+        """
+        # Limit the filename length here so it doesn't get chopped off...
+        copies_text = f" x{copies}" if copies > 1 else ""
+        description = f"{name_file[:self.file_name_width - 12 - len(copies_text)]} ({size_file/1024/1024/1024:.2f} GB){copies_text}"
+        task = self.current_file.add_task(description.ljust(self.file_name_width), total=size_file * copies, completed=completed)
+        self._resize_current_file_panel()
+        return task
+
+    def file_callback(self, task: TaskID):
+        """
+        Returns a copy_with_callback compatible callback that advances the given file's progress
+        (plus the overall and library progress).  Call it from one thread only.
+        """
+        counter = self._add_counter(task, self.current_library_task)
+
+        # noinspection PyUnusedLocal
+        def callback(bytes_since_last_update, total_bytes_copied, size):
+            counter.value += bytes_since_last_update
+        return callback
+
+    def add_destination(self, name, size: int) -> TaskID:
+        """
+        Add a progress bar for one destination of a fan-out copy (in place of the library bar)
+        """
+        task = self.overall.add_task(name[:10].ljust(10), total=size)
+        self.layout["upper"].size = len(self.overall.task_ids) + 2
+        return task
+
+    def destination_callback(self, file_task: TaskID, destination_task: TaskID):
+        """
+        Like file_callback, but for one destination of a fan-out copy - advances the file's progress, the
+        destination's and the overall progress
+        """
+        counter = self._add_counter(file_task, destination_task)
+
+        # noinspection PyUnusedLocal
+        def callback(bytes_since_last_update, total_bytes_copied, size):
+            counter.value += bytes_since_last_update
+        return callback
+
+    def _add_counter(self, file_task: TaskID, group_task: TaskID) -> _ByteCounter:
+        counter = _ByteCounter(file_task, group_task)
+        with self._counters_lock:
+            self._counters.append(counter)
+        return counter
+
+    def flush(self):
+        """
+        Push the bytes counted since the last flush to the progress bars - one update per bar
+        """
+        with self._counters_lock:
+            advances = Counter()
+            for counter in self._counters:
+                value = counter.value
+                if value != counter.flushed:
+                    advances[("file", counter.file_task)] += value - counter.flushed
+                    advances[("group", counter.group_task)] += value - counter.flushed
+                    counter.flushed = value
+            total = 0
+            for (kind, task), advance in advances.items():
+                if kind == "file":
+                    self.current_file.update(task, advance=advance)
+                    total += advance
+                else:
+                    self.overall.update(task, advance=advance)
+            if total:
+                self.overall.update(self.overall_task, advance=total)
+
+    def complete_file(self, task: TaskID):
+        self.flush()
+        with self._counters_lock:
+            self._counters = [counter for counter in self._counters if counter.file_task != task]
+        self.current_file.remove_task(task)
+        self._resize_current_file_panel()
+
+    # noinspection PyUnusedLocal
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        self.flush()
+        yield self.layout
+
+    def _resize_current_file_panel(self):
+        # One line per file being copied, plus the panel border
+        self.layout["lower"].size = max(len(self.current_file.task_ids), 1) + 2
 
     def update_overall_and_library_progress(self, advance: int):
         self.overall.update(self.overall_task, advance=advance)
@@ -104,12 +208,14 @@ class CopyProgress:
     # Callback, so needs to have this signature
     # noinspection PyUnusedLocal
     def update_current_file_progress(self, bytes_since_last_update, total_bytes_copied, size):
-        self.current_file.update(self.current_file_task, advance=bytes_since_last_update)
-        self.overall.update(self.overall_task, advance=bytes_since_last_update)
-        self.overall.update(self.current_library_task, advance=bytes_since_last_update)
+        if self._legacy_callback is None:
+            self._legacy_callback = self.file_callback(self.current_file_task)
+        self._legacy_callback(bytes_since_last_update, total_bytes_copied, size)
 
     def complete_current_library(self):
+        self.flush()
         self.overall.remove_task(self.current_library_task)
 
     def complete_current_file(self):
-        self.current_file.remove_task(self.current_file_task)
+        self.complete_file(self.current_file_task)
+        self._legacy_callback = None